@@ -1,17 +1,28 @@
 import streamlit as st
-import pdfplumber
-import pytesseract
-from PIL import Image
 import re
 import time
 import io
 import random
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
 import base64
 import os
+import json
+import threading
+import heapq
+import itertools
+import bisect
+import math
+import uuid
+import hashlib
+import tempfile
+import sqlite3
+import zlib
+import atexit
+import contextlib
+import functools
+import logging
+import hmac
+import runpy
 
 # Sound functions
 def autoplay_audio(sound_type):
@@ -33,34 +44,406 @@ def autoplay_audio(sound_type):
         """
     st.markdown(sound_file, unsafe_allow_html=True)
 
-def extract_text_from_pdf(pdf_file):
+def st_notify(level, message):
+    """Show a status message in the running Streamlit script"""
+    getattr(st, level)(message)
+
+# Metrics
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PORT = os.environ.get("PDF_QUIZ_METRICS_PORT", "")  # serve /metrics on this port when set
+METRICS_FILE = os.environ.get("PDF_QUIZ_METRICS_FILE", "")  # or write a textfile-collector file, "{pid}" is expanded
+METRICS_FILE_SECONDS = 15
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Metrics:
+    """Process-wide counters and latency histograms in Prometheus text format"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        slot = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            histogram[slot] += 1
+            histogram[-1] += seconds
+
+    def drain(self):
+        """Take everything recorded so far, leaving the registry empty"""
+        with self._lock:
+            counters, histograms = self.counters, self.histograms
+            self.counters, self.histograms = {}, {}
+        return counters, histograms
+
+    def merge(self, counters, histograms):
+        """Add another registry's drained values, e.g. from a worker process"""
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, values in histograms.items():
+                histogram = self.histograms.setdefault(key, [0] * len(values))
+                for slot, value in enumerate(values):
+                    histogram[slot] += value
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("pdfquiz_span_seconds", time.perf_counter() - start, span=name)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(value)) for key, value in self.histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {histogram[-1]:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def start_metrics_exporters(metrics):
+    """Serve /metrics over HTTP and/or refresh a metrics file, as configured"""
+    if METRICS_PORT:
+        import http.server
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.end_headers()
+                self.wfile.write(body if self.path.startswith("/metrics") else b"")
+
+            def log_message(self, *args):
+                pass
+        try:
+            server = http.server.ThreadingHTTPServer(("", int(METRICS_PORT)), MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        except OSError as e:
+            logging.getLogger(__name__).warning("Metrics port %s unavailable: %s", METRICS_PORT, e)
+    if METRICS_FILE:
+        path = METRICS_FILE.format(pid=os.getpid())
+        def write_metrics_file():
+            while True:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(metrics.render())
+                os.replace(tmp_path, path)
+                time.sleep(METRICS_FILE_SECONDS)
+        threading.Thread(target=write_metrics_file, name="metrics-file", daemon=True).start()
+
+@st.cache_resource
+def get_metrics():
+    """One metrics registry per process, exported as configured"""
+    metrics = Metrics()
+    start_metrics_exporters(metrics)
+    return metrics
+
+def current_metrics():
+    """This thread's registry, looked up through the resource cache only once per thread"""
+    # Background workers have no script context, so they are handed the registry instead
+    thread = threading.current_thread()
+    metrics = getattr(thread, "metrics", None)
+    if metrics is None:
+        metrics = thread.metrics = get_metrics()
+    return metrics
+
+def cache_miss():
+    """Called from a cached function's body, which only runs on a miss"""
+    threading.current_thread().cache_miss = True
+
+def cached(cache, func, *args, **kwargs):
+    """Call a cached function, counting the lookup as a hit or a miss"""
+    thread = threading.current_thread()
+    thread.cache_miss = False
+    value = func(*args, **kwargs)
+    current_metrics().inc("pdfquiz_cache_requests_total", cache=cache, result="miss" if thread.cache_miss else "hit")
+    return value
+
+def timed(name):
+    """Record every call of the decorated function as a span"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with current_metrics().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class RerunTimer:
+    """Times consecutive sections of one script run and the run as a whole"""
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.mark = time.perf_counter()
+        self.section_name = None
+
+    def section(self, name):
+        now = time.perf_counter()
+        if self.section_name:
+            self.metrics.observe("pdfquiz_span_seconds", now - self.mark, span=f"render_{self.section_name}")
+        self.section_name, self.mark = name, now
+
+    def finish(self):
+        self.section(None)
+        self.metrics.observe("pdfquiz_rerun_seconds", time.perf_counter() - self.start)
+        self.metrics.inc("pdfquiz_reruns_total")
+
+# Profiling
+PROFILE_TOKEN = os.environ.get("PDF_QUIZ_PROFILE_TOKEN", "")  # operators open the app with ?operator=<token>
+PROFILE_TOP = 40
+
+def is_operator():
+    """Whether this session may use the profiling tools"""
+    token = st.query_params.get('operator', '')
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def _site(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+class Profiler:
+    """Runs one block at a time under cProfile and tracemalloc and files the report"""
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()  # tracemalloc is process-wide, so profiles never overlap
+
+    @contextlib.contextmanager
+    def profile(self, label, report):
+        """Profile the block, filling report with a short summary when it exits"""
+        import cProfile
+        import tracemalloc
+        if not self._lock.acquire(blocking=False):
+            report.update(label=label, error="Another profile was running, nothing was recorded")
+            yield report
+            return
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+            try:
+                self._write(label, profiler, before, after, seconds, peak, report)
+            except Exception as e:
+                report.update(label=label, error=f"Could not write the profile: {e}")
+            finally:
+                self._lock.release()
+
+    def _write(self, label, profiler, before, after, seconds, peak, report):
+        import pstats
+        import tracemalloc
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, contextlib.__file__))
+        allocations = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), "lineno")
+        allocations = [stat for stat in allocations if stat.size_diff > 0]
+        allocations.sort(key=lambda stat: -stat.size_diff)
+        stats = pstats.Stats(profiler)
+        
+        os.makedirs(self.directory, exist_ok=True)
+        stem = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S}-{label}-{uuid.uuid4().hex[:6]}")
+        stats.dump_stats(f"{stem}.prof")  # full call graph for snakeviz / gprof2dot
+        text = io.StringIO()
+        text.write(f"{label}: {seconds:.3f}s wall, {peak / 2**20:.1f} MiB peak traced memory\n\n")
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        pstats.Stats(profiler, stream=text).sort_stats("tottime").print_callers(PROFILE_TOP // 4)
+        text.write("Top allocation sites (net new memory)\n")
+        for stat in allocations[:PROFILE_TOP]:
+            text.write(f"{stat.size_diff / 1024:10.1f} KiB {stat.count_diff:8d} blocks  {_site(stat.traceback[0])}\n")
+        with open(f"{stem}.txt", "w") as f:
+            f.write(text.getvalue())
+        
+        hotspots = sorted(stats.stats.items(), key=lambda item: -item[1][2])[:5]  # by own time
+        report.update(
+            label=label,
+            seconds=seconds,
+            peak_mb=peak / 2**20,
+            hotspots=[(f"{os.path.basename(path)}:{line}({func})", own) for (path, line, func), (_, _, own, _, _) in hotspots],
+            allocations=[(_site(stat.traceback[0]), stat.size_diff / 1024) for stat in allocations[:5]],
+            path=f"{stem}.txt",
+        )
+
+@st.cache_resource
+def get_profiler():
+    """One profiler per process, writing under the app's data directory"""
+    return Profiler(os.path.join(DATA_DIR, "profiles"))
+
+def render_profile_report(report):
+    """Short in-app summary of the last profile"""
+    if report.get("error"):
+        st.warning(f"{report['label']}: {report['error']}")
+        return
+    st.caption(f"**{report['label']}**: {report['seconds']:.2f}s, {report['peak_mb']:.1f} MiB peak")
+    st.markdown("\n".join(f"- `{site}` {own * 1000:.1f} ms" for site, own in report['hotspots']))
+    st.markdown("\n".join(f"- `{site}` {kib:.0f} KiB" for site, kib in report['allocations']))
+    st.caption(f"Full report: `{report['path']}`")
+
+# Figure extraction
+QUESTION_SPLIT = re.compile(r'(?i)Q\d+\.|\n\d+\.')
+FIGURE_CACHE_DIR = os.environ.get("PDF_QUIZ_FIGURE_CACHE", os.path.join(tempfile.gettempdir(), "pdf_quiz_figures"))
+FIGURE_RESOLUTION = 150
+THUMBNAIL_SIZE = (480, 320)
+MIN_FIGURE_POINTS = 24
+
+def thumbnail_format():
+    """WebP thumbnails where this Pillow build supports them"""
+    from PIL import features
+    return "WEBP" if features.check("webp") else "PNG"
+
+def figure_path(key, thumbnail=False):
+    """Location of a cached figure in the content-addressed store"""
+    if thumbnail:
+        return os.path.join(FIGURE_CACHE_DIR, f"{key}-thumb.{thumbnail_format().lower()}")
+    return os.path.join(FIGURE_CACHE_DIR, f"{key}.png")
+
+def _write_atomic(path, image, image_format):
+    # Parse workers may store the same figure at once, so never expose a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    image.save(tmp_path, format=image_format)
+    os.replace(tmp_path, path)
+
+def store_figure(image):
+    """Save a figure and its downscaled thumbnail under its content hash"""
+    png = io.BytesIO()
+    image.save(png, format="PNG")
+    key = hashlib.sha256(png.getvalue()).hexdigest()[:32]
+    if not os.path.exists(figure_path(key)):
+        os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+        thumb = image.copy()
+        thumb.thumbnail(THUMBNAIL_SIZE)
+        # Thumbnail first: the full image existing means both are ready
+        _write_atomic(figure_path(key, thumbnail=True), thumb, thumbnail_format())
+        _write_atomic(figure_path(key), image, "PNG")
+    return key
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def load_figure(key, thumbnail=True):
+    """Read a cached figure once per process instead of on every rerun"""
+    cache_miss()
+    try:
+        with open(figure_path(key, thumbnail), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def extract_page_figures(page, questions_before, at_document_start):
+    """Crop embedded images on a page and file them under the question whose region holds them"""
+    page_area = page.width * page.height
+    images = [im for im in page.images
+              if im["x1"] - im["x0"] >= MIN_FIGURE_POINTS and im["bottom"] - im["top"] >= MIN_FIGURE_POINTS
+              # A page-sized image is a scan, not a figure
+              and (im["x1"] - im["x0"]) * (im["bottom"] - im["top"]) < 0.9 * page_area]
+    if not images:
+        return {}
+    
+    # Question regions start at the lines where parse_pdf_content splits the text
+    starts = []
+    question_num = questions_before
+    for n, line in enumerate(page.extract_text_lines()):
+        prefix = "" if n == 0 and at_document_start else "\n"
+        for _ in QUESTION_SPLIT.findall(prefix + line["text"]):
+            question_num += 1
+            starts.append((line["top"], question_num))
+    
+    found = {}
+    x0, top, x1, bottom = page.bbox
+    for im in images:
+        middle = (im["top"] + im["bottom"]) / 2
+        owner = questions_before  # Images above the first marker continue the previous question
+        for start_top, start_num in starts:
+            if start_top > middle:
+                break
+            owner = start_num
+        if not owner:
+            continue
+        bbox = (max(im["x0"], x0), max(im["top"], top), min(im["x1"], x1), min(im["bottom"], bottom))
+        crop = page.crop(bbox).to_image(resolution=FIGURE_RESOLUTION).original
+        found.setdefault(owner, []).append(store_figure(crop))
+    return found
+
+def extract_text_from_pdf(pdf_file, progress=None, notify=st_notify, figures=None):
     """Extract text from PDF with OCR support for scanned PDFs"""
+    import pdfplumber  # Heavy, so loaded on the first upload rather than at startup
+    metrics = current_metrics()
     text = ""
+    question_count = 0
     
     try:
         with pdfplumber.open(pdf_file) as pdf:
-            for page in pdf.pages:
+            total_pages = len(pdf.pages)
+            for page_num, page in enumerate(pdf.pages, 1):
+                if progress:
+                    progress(page_num / total_pages, f"Reading page {page_num} of {total_pages}")
                 # Try to extract text directly first
-                page_text = page.extract_text()
+                with metrics.span("page_text"):
+                    page_text = page.extract_text()
                 if page_text and page_text.strip():
-                    text += page_text + "\n"
+                    metrics.inc("pdfquiz_pages_total", kind="text")
+                    if figures is not None:
+                        try:
+                            with metrics.span("page_figures"):
+                                page_figures = extract_page_figures(page, question_count, not text)
+                            for question_num, keys in page_figures.items():
+                                figures.setdefault(question_num, []).extend(keys)
+                        except Exception:
+                            notify("warning", "Some figures could not be extracted")
                 else:
                     # If no text found, use OCR for scanned PDFs
+                    metrics.inc("pdfquiz_pages_total", kind="ocr")
                     try:
-                        image = page.to_image()
-                        img_bytes = io.BytesIO()
-                        image.save(img_bytes, format='PNG')
-                        img_bytes.seek(0)
-                        ocr_text = pytesseract.image_to_string(Image.open(img_bytes))
-                        text += ocr_text + "\n"
+                        import pytesseract
+                        from PIL import Image
+                        with metrics.span("page_ocr"):
+                            image = page.to_image()
+                            img_bytes = io.BytesIO()
+                            image.save(img_bytes, format='PNG')
+                            img_bytes.seek(0)
+                            page_text = pytesseract.image_to_string(Image.open(img_bytes))
                     except:
-                        st.warning("Some pages might not have readable text")
+                        notify("warning", "Some pages might not have readable text")
                         continue
+                question_count += len(QUESTION_SPLIT.findall(("\n" if text else "") + page_text))
+                text += page_text + "\n"
     except Exception as e:
-        st.error(f"Error processing PDF: {str(e)}")
+        notify("error", f"Error processing PDF: {str(e)}")
     
     return text
 
+@timed("explanation")
 def generate_ai_explanation(question, correct_answer, options):
     """Generate AI explanation for questions"""
     explanations = {
@@ -98,12 +481,14 @@ def generate_ai_explanation(question, correct_answer, options):
     
     return detailed_explanation
 
-def parse_pdf_content(pdf_file):
+@timed("parse_pdf")
+def parse_pdf_content(pdf_file, progress=None, notify=st_notify):
     questions = []
-    text = extract_text_from_pdf(pdf_file)
+    figures = {}
+    text = extract_text_from_pdf(pdf_file, progress=progress, notify=notify, figures=figures)
     
     # More robust question splitting
-    question_blocks = re.split(r'(?i)Q\d+\.|\n\d+\.', text)
+    question_blocks = QUESTION_SPLIT.split(text)
     
     for i, block in enumerate(question_blocks[1:], 1):
         try:
@@ -142,7 +527,8 @@ def parse_pdf_content(pdf_file):
                 "options": options,
                 "correct_answer": correct_answer,
                 "ai_explanation": ai_explanation,
-                "difficulty": random.choice(["Easy", "Medium", "Hard"]),
+                "difficulty": "Medium",  # Neutral prior until students' answers rate it
+                "figures": figures.get(i, []),
                 "time_spent": 0,
                 "attempts": 0,
                 "start_time": None,
@@ -151,9 +537,1324 @@ def parse_pdf_content(pdf_file):
         except Exception as e:
             continue
     
+    current_metrics().inc("pdfquiz_questions_total", len(questions), source="pdf")
     return questions
 
+# Structured question bank import
+BANK_FILE_TYPES = ["csv", "jsonl", "xlsx"]
+OPTION_LETTERS = ["A", "B", "C", "D", "E"]
+DIFFICULTY_LEVELS = ["Easy", "Medium", "Hard"]
+
+def _cell_text(value):
+    """A cell as trimmed text, blank for empty cells; numbers keep the form they were stored in"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value).strip()
+
+def _options_to_columns(values):
+    """Expand an 'options' column (dict, list or JSON text) into one column per letter"""
+    rows = []
+    for value in values:
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                # Fall back to "A) text | B) text" style cells
+                value = dict(re.findall(r'([A-E])\)\s*([^|]*)', value))
+        if isinstance(value, list):
+            value = dict(zip(OPTION_LETTERS, value))
+        rows.append(value if isinstance(value, dict) else {})
+    import pandas as pd
+    return pd.DataFrame(rows, columns=OPTION_LETTERS, dtype=object)
+
+def read_question_bank(bank_file, file_name):
+    """Load a CSV, JSON Lines or XLSX export into a DataFrame"""
+    import pandas as pd
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(bank_file, dtype=str, keep_default_na=False)
+    if ext == ".jsonl":
+        # read_json turns integer columns with gaps into floats ("5" -> "5.0"), so keep each cell as parsed
+        records = [json.loads(line) for line in bank_file.read().decode("utf-8-sig").splitlines() if line.strip()]
+        return pd.DataFrame(records, dtype=object)
+    if ext == ".xlsx":
+        # Stream cell values in read-only mode instead of building the full workbook model
+        import openpyxl
+        workbook = openpyxl.load_workbook(bank_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, ())
+            return pd.DataFrame(list(rows), columns=[str(c) for c in header], dtype=object)
+        finally:
+            workbook.close()
+    raise ValueError(f"Unsupported question bank format: {ext or file_name}")
+
+@timed("import_bank")
+def import_question_bank(bank_file, file_name):
+    """Build question records straight from a structured bank, returning (questions, problems)"""
+    import pandas as pd
+    df = read_question_bank(bank_file, file_name)
+    df.columns = [str(c).strip() for c in df.columns]
+    rename = {}
+    for col in df.columns:
+        key = col.lower().replace(" ", "_")
+        if key.startswith("option_") and key[7:].upper() in OPTION_LETTERS:
+            rename[col] = key[7:].upper()
+        elif key.upper() in OPTION_LETTERS:
+            rename[col] = key.upper()
+        elif key in ("question", "options", "answer", "difficulty"):
+            rename[col] = key
+        elif key == "correct_answer":
+            rename[col] = "answer"
+    df = df.rename(columns=rename)
+
+    missing = [c for c in ("question", "answer") if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+
+    if "options" in df.columns:
+        options = _options_to_columns(df["options"])
+    else:
+        options = df.reindex(columns=OPTION_LETTERS)
+    # Cell by cell, so numeric options are never widened to float by a blank in their column
+    options = options.apply(lambda col: col.map(_cell_text))
+    options.index = df.index
+
+    question = df["question"].map(_cell_text)
+    answer = df["answer"].map(_cell_text).str.upper().str[:1]
+    if "difficulty" in df.columns:
+        difficulty = df["difficulty"].map(_cell_text).str.capitalize()
+        difficulty = difficulty.where(difficulty.isin(DIFFICULTY_LEVELS), "Medium")
+    else:
+        difficulty = pd.Series("Medium", index=df.index)
+
+    # Validate every row at once: a question and an answer letter that has option text
+    answer_has_text = pd.Series(False, index=df.index)
+    for letter in OPTION_LETTERS:
+        answer_has_text |= (answer == letter) & (options[letter] != "")
+    valid = (question != "") & answer_has_text
+
+    problems = []
+    bad_rows = ((~valid).to_numpy().nonzero()[0] + 2).tolist()  # +2 for header and 1-based rows
+    if bad_rows:
+        shown = ", ".join(str(n) for n in bad_rows[:10])
+        more = f" and {len(bad_rows) - 10} more" if len(bad_rows) > 10 else ""
+        problems.append(f"Skipped {len(bad_rows)} row(s) missing a question or a valid answer: {shown}{more}")
+
+    questions = []
+    option_columns = [options[letter][valid].tolist() for letter in OPTION_LETTERS]
+    rows = zip(question[valid].tolist(), zip(*option_columns), answer[valid].tolist(), difficulty[valid].tolist())
+    for i, (question_text, option_texts, correct_answer, level) in enumerate(rows, 1):
+        row_options = {letter: text for letter, text in zip(OPTION_LETTERS, option_texts) if text}
+        questions.append({
+            "id": i,
+            "question": question_text,
+            "options": row_options,
+            "correct_answer": correct_answer,
+            "ai_explanation": generate_ai_explanation(question_text, correct_answer, row_options),
+            "difficulty": level,
+            "figures": [],
+            "time_spent": 0,
+            "attempts": 0,
+            "start_time": None,
+            "question_timer": 0
+        })
+
+    current_metrics().inc("pdfquiz_questions_total", len(questions), source="bank")
+    return questions, problems
+
+# Question search
+MAX_PREFIX_EXPANSIONS = 64
+MAX_SEARCH_RESULTS = 100
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+class SearchIndex:
+    """Inverted index over question and option text, built once per bank"""
+    def __init__(self, questions):
+        self.size = len(questions)
+        self.postings = {}  # term -> {question position: weight}
+        for pos, question in enumerate(questions):
+            # Matches in the question itself count double against option matches
+            for term in tokenize(question['question']):
+                entry = self.postings.setdefault(term, {})
+                entry[pos] = entry.get(pos, 0) + 2
+            for opt_text in question['options'].values():
+                for term in tokenize(opt_text):
+                    entry = self.postings.setdefault(term, {})
+                    entry[pos] = entry.get(pos, 0) + 1
+        self.terms = sorted(self.postings)
+
+    def _matches(self, term, prefix):
+        """Combined postings for a term, or for every indexed term it prefixes"""
+        if not prefix:
+            return self.postings.get(term, {})
+        start = bisect.bisect_left(self.terms, term)
+        expansions = itertools.takewhile(lambda t: t.startswith(term), self.terms[start:start + MAX_PREFIX_EXPANSIONS])
+        merged = {}
+        for expansion in expansions:
+            for pos, weight in self.postings[expansion].items():
+                merged[pos] = max(merged.get(pos, 0), weight)
+        return merged
+
+    def search(self, query, limit=MAX_SEARCH_RESULTS):
+        """The best `limit` positions of questions matching every query term, and the number of matches.
+
+        The last word is matched as a prefix while it is still being typed.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        last_is_prefix = not query[-1:].isspace()
+        scores = None
+        # Intersect rarest terms first so the candidate set stays small
+        matches = [self._matches(term, last_is_prefix and n == len(terms) - 1) for n, term in enumerate(terms)]
+        for postings in sorted(matches, key=len):
+            idf = math.log(1 + self.size / (len(postings) or 1))
+            if scores is None:
+                scores = {pos: weight * idf for pos, weight in postings.items()}
+            else:
+                scores = {pos: score + postings[pos] * idf for pos, score in scores.items() if pos in postings}
+            if not scores:
+                return [], 0
+        # Broad queries match most of the bank, so only the shown results are ordered
+        return heapq.nsmallest(limit, scores, key=lambda pos: (-scores[pos], pos)), len(scores)
+
+BANK_CACHE_ENTRIES = 32  # banks whose shared indexes stay in memory
+
+@st.cache_resource(max_entries=BANK_CACHE_ENTRIES, show_spinner=False)
+def _bank_search_index(bank_key, _questions):
+    cache_miss()
+    with current_metrics().span("search_index_build"):
+        return SearchIndex(_questions)
+
+def get_search_index(questions):
+    """The current bank's search index, built once per bank and shared by every session on it"""
+    return cached("search_index", _bank_search_index, st.session_state.bank_key, questions)
+
+# Near-duplicate detection
+SHINGLE_SIZE = 5
+LSH_BANDS = 20
+LSH_ROWS = 3
+MINHASH_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+DUPLICATE_THRESHOLD = 0.8  # estimated Jaccard similarity of the shingle sets
+MAX_BUCKET_SIZE = 16  # canonical ids kept per LSH bucket, so templated banks stay linear
+MINHASH_BATCH = 1024  # texts hashed per vectorised pass, bounding the temporary arrays to a few MB
+
+def duplicate_text(question):
+    """Normalised question and option text that near-duplicates share"""
+    return " ".join(tokenize(question['question']) + tokenize(" ".join(sorted(question['options'].values()))))
+
+NUMBER_PATTERN = re.compile(r'\b\d+\b')
+
+def duplicate_key(question):
+    """Normalised correct answer and the numbers in the stem, which near-duplicates must agree on exactly"""
+    numbers = NUMBER_PATTERN.findall(question['question'])
+    return " ".join(tokenize(question['options'].get(question['correct_answer'], ""))), tuple(numbers)
+
+def card_id(question):
+    """Content id of one question, used for its review card"""
+    content = json.dumps([question['question'], question['options'], question['correct_answer']], sort_keys=True)
+    return hashlib.blake2b(content.encode(), digest_size=8).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def minhash_permutations():
+    """(a, b) of every permutation, drawn from a fixed seed so signatures are stable across processes"""
+    import numpy as np
+    rng = np.random.default_rng(20240601)
+    # Permutations are x -> a * x + b mod 2**32 with odd a, applied to mixed 32-bit shingle hashes
+    a = rng.integers(0, 1 << 32, MINHASH_PERMUTATIONS, dtype=np.uint64).astype(np.uint32) | np.uint32(1)
+    b = rng.integers(0, 1 << 32, MINHASH_PERMUTATIONS, dtype=np.uint64).astype(np.uint32)
+    return a, b
+
+def _mix_shingles(shingles):
+    """Spread packed shingles over 32 bits (the murmur3 finaliser) so the linear permutations look random"""
+    import numpy as np
+    shingles ^= shingles >> np.uint64(33)
+    shingles *= np.uint64(0xff51afd7ed558ccd)
+    shingles ^= shingles >> np.uint64(33)
+    shingles *= np.uint64(0xc4ceb9fe1a85ec53)
+    shingles ^= shingles >> np.uint64(33)
+    return (shingles >> np.uint64(32)).astype(np.uint32)
+
+def minhash_signatures(texts):
+    """MinHash signatures over byte shingles, one row per text, computed a batch of texts at a time"""
+    import numpy as np
+    multipliers, offsets = minhash_permutations()
+    signatures = np.empty((len(texts), MINHASH_PERMUTATIONS), dtype=np.uint32)
+    for start in range(0, len(texts), MINHASH_BATCH):
+        encoded = [text.encode().ljust(SHINGLE_SIZE) for text in texts[start:start + MINHASH_BATCH]]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        # Pack each window of SHINGLE_SIZE bytes into one integer, for every text at once
+        windows = len(data) - SHINGLE_SIZE + 1
+        shingles = np.zeros(windows, dtype=np.uint64)
+        for offset in range(SHINGLE_SIZE):
+            shingles |= data[offset:offset + windows] << np.uint64(8 * offset)
+        # Drop the windows that run from one text into the next
+        ends = np.cumsum(lengths)
+        owner = np.repeat(np.arange(len(encoded)), lengths)[:windows]
+        hashes = _mix_shingles(shingles[np.arange(windows) + SHINGLE_SIZE <= ends[owner]])
+        permuted = multipliers[:, None] * hashes[None, :]
+        permuted += offsets[:, None]
+        firsts = np.concatenate(([0], np.cumsum(lengths - SHINGLE_SIZE + 1)[:-1]))
+        signatures[start:start + len(encoded)] = np.minimum.reduceat(permuted, firsts, axis=1).T
+    return signatures
+
+def lsh_bucket_keys(signatures, keys):
+    """One 64-bit bucket key per band of each signature, also covering the band number and the duplicate key"""
+    import numpy as np
+    bands = signatures.reshape(len(signatures), LSH_BANDS, LSH_ROWS).astype(np.uint64)
+    mixed = bands[:, :, 0] << np.uint64(32) | bands[:, :, 1]
+    mixed ^= bands[:, :, 2] * np.uint64(0x9e3779b97f4a7c15)
+    mixed ^= np.arange(LSH_BANDS, dtype=np.uint64) * np.uint64(0xc2b2ae3d27d4eb4f)
+    # Process-local hashes are fine, buckets are never stored
+    mixed ^= np.array([hash(key) for key in keys], dtype=np.int64).view(np.uint64)[:, None]
+    return mixed.tolist()
+
+class DuplicateIndex:
+    """LSH index of canonical questions shared by every bank loaded in this process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.buckets = {}  # bucket key -> canonical ids, at most MAX_BUCKET_SIZE each
+        self.signatures = {}  # canonical id -> MinHash signature
+        self.origins = {}  # canonical id -> (bank, question id) that introduced it
+        self.banks = {}  # bank key -> canonical id of each question, so reloads skip matching
+        self.stats = {}  # canonical id -> [attempts, correct], pooled over every copy
+
+    def _closest(self, signature, buckets):
+        """Best canonical match above the threshold among the question's LSH bucket-mates"""
+        import numpy as np
+        candidates = list(dict.fromkeys(itertools.chain.from_iterable(buckets)))
+        # Score every candidate in one vectorised comparison
+        scores = (np.stack([self.signatures[c] for c in candidates]) == signature).mean(axis=1)
+        best = int(scores.argmax())
+        return candidates[best] if scores[best] >= DUPLICATE_THRESHOLD else None
+
+    def _canonical_ids(self, bank, questions):
+        # Signatures are the expensive part, so the whole bank is hashed in batches before taking the lock
+        texts = [duplicate_text(question) for question in questions]
+        keys = [duplicate_key(question) for question in questions]
+        signatures = minhash_signatures(texts)
+        bucket_keys = lsh_bucket_keys(signatures, keys)
+        exact_ids = [hashlib.blake2b(f"{text}\0{key[0]}".encode(), digest_size=8).hexdigest()
+                     for text, key in zip(texts, keys)]
+        canonical_ids = []
+        with self._lock:
+            for question, text, exact_id, signature, band_keys in zip(questions, texts, exact_ids, signatures, bucket_keys):
+                # Empty text has no shingles to compare, so it only matches identical questions
+                band_keys = band_keys if text else ()
+                buckets = [bucket for bucket in map(self.buckets.get, band_keys) if bucket]
+                canonical_id = self._closest(signature, buckets) if buckets else None
+                if canonical_id is None:
+                    canonical_id = exact_id
+                    if canonical_id not in self.origins:
+                        self.origins[canonical_id] = (bank, question['id'])
+                        if band_keys:
+                            self.signatures[canonical_id] = signature
+                            for band_key in band_keys:
+                                bucket = self.buckets.setdefault(band_key, [])
+                                if len(bucket) < MAX_BUCKET_SIZE:
+                                    bucket.append(canonical_id)
+                canonical_ids.append(canonical_id)
+        return canonical_ids
+
+    def register_bank(self, bank_key, bank, questions):
+        """Give every question a canonical id and flag near-duplicates, returning how many were found"""
+        canonical_ids = self.banks.get(bank_key)
+        if canonical_ids is None:
+            canonical_ids = self.banks[bank_key] = self._canonical_ids(bank, questions)
+        duplicates = 0
+        for question, canonical_id in zip(questions, canonical_ids):
+            origin = self.origins[canonical_id]
+            # Reloading a bank matches its own questions, which are not duplicates
+            question['duplicate_of'] = origin if origin != (bank, question['id']) else None
+            question['canonical_id'] = canonical_id
+            question['card_id'] = card_id(question)
+            if question['duplicate_of']:
+                duplicates += 1
+        return duplicates
+
+    def record_attempt(self, canonical_id, correct):
+        with self._lock:
+            stats = self.stats.setdefault(canonical_id, [0, 0])
+            stats[0] += 1
+            stats[1] += int(correct)
+
+    def attempt_stats(self, canonical_id):
+        """(attempts, correct) across every copy of a question"""
+        return tuple(self.stats.get(canonical_id, (0, 0)))
+
+@st.cache_resource
+def get_duplicate_index():
+    """One near-duplicate index shared by every session in this process"""
+    return DuplicateIndex()
+
+# Adaptive difficulty
+DATA_DIR = os.environ.get("PDF_QUIZ_DATA_DIR", os.path.join(os.path.expanduser("~"), ".pdf_quiz_pro"))
+RATING_DB = os.path.join(DATA_DIR, "ratings.sqlite3")
+DIFFICULTY_PRIORS = {"Easy": -1.0, "Medium": 0.0, "Hard": 1.0}
+RATING_K = 0.4  # step size for a question or student with no answers yet
+RATING_MIN_K = 0.05
+CALIBRATED_ATTEMPTS = 5  # answers before a question's rating overrides its prior label
+RECALIBRATE_EVERY = 500  # new answers between batch recalibrations
+TARGET_SUCCESS = 0.7  # adaptive practice aims for questions answered correctly this often
+SELECTION_BINS = 32
+RATING_RANGE = 4.0  # ratings are binned over [-RATING_RANGE, RATING_RANGE]
+
+def _grow(array, size):
+    """Return array with room for at least size rows, doubling its capacity"""
+    import numpy as np
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def student_key():
+    """Who this session's ratings and reviews belong to: the Student ID, or the browser session without one"""
+    return st.session_state.student_name.strip() or st.session_state.session_id
+
+class RatingStore:
+    """SQLite log of every rated answer, shared by all app processes and replayed on startup"""
+    def __init__(self, path=RATING_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS rating_attempts (
+            student TEXT NOT NULL, canonical_id TEXT NOT NULL, correct INTEGER NOT NULL, answered REAL NOT NULL)""")
+
+    def add(self, student, canonical_id, correct):
+        with self._lock:
+            self._conn.execute("INSERT INTO rating_attempts VALUES (?, ?, ?, ?)",
+                               (student, canonical_id, int(correct), time.time()))
+
+    def load(self):
+        """Every attempt as (student, canonical id, correct), oldest first"""
+        with self._lock:
+            return self._conn.execute("SELECT student, canonical_id, correct FROM rating_attempts ORDER BY rowid").fetchall()
+
+class RatingEngine:
+    """Elo-style Rasch ratings for questions and students.
+
+    Each answer nudges both ratings in O(1). The full attempt history is
+    periodically refitted in vectorised batches on a background thread.
+    Questions are keyed by canonical id, so near-duplicate copies share a rating.
+    With a store, refits read every process's answers from it, starting with
+    one when the engine is created.
+    """
+    def __init__(self, store=None):
+        import numpy as np
+        self._lock = threading.Lock()
+        self.store = store
+        self.question_rows = {}  # canonical id -> row
+        self.question_ids = []  # row -> canonical id
+        self.unlabelled = set()  # rows only seen in the stored history, whose prior label is not known yet
+        self.question_rating = np.zeros(1024, dtype=np.float32)
+        self.question_prior = np.zeros(1024, dtype=np.float32)
+        self.question_answers = np.zeros(1024, dtype=np.int32)
+        self.student_rows = {}  # student -> row
+        self.student_rating = np.zeros(256, dtype=np.float32)
+        self.student_answers = np.zeros(256, dtype=np.int32)
+        self.history = np.zeros((4096, 3), dtype=np.int32)  # (student row, question row, correct)
+        self.history_len = 0
+        self.version = 0  # bumped whenever a recalibration replaces the ratings
+        self._since_calibration = 0
+        self._calibrating = store is not None
+        if store is not None:
+            threading.Thread(target=self.recalibrate, name="rating-calibration", daemon=True).start()
+
+    def _question_row(self, canonical_id):
+        row = self.question_rows.get(canonical_id)
+        if row is None:
+            row = self.question_rows[canonical_id] = len(self.question_ids)
+            self.question_ids.append(canonical_id)
+            self.question_rating = _grow(self.question_rating, row + 1)
+            self.question_prior = _grow(self.question_prior, row + 1)
+            self.question_answers = _grow(self.question_answers, row + 1)
+            self.unlabelled.add(row)
+        return row
+
+    def register(self, questions):
+        """Rows for a bank's questions, as a compact index array cached per bank"""
+        import numpy as np
+        rows = np.empty(len(questions), dtype=np.int32)
+        with self._lock:
+            for pos, question in enumerate(questions):
+                row = self._question_row(question['canonical_id'])
+                if row in self.unlabelled:
+                    self.unlabelled.discard(row)
+                    prior = DIFFICULTY_PRIORS.get(question['difficulty'], 0.0)
+                    # Ratings replayed from the store already moved away from the prior, so keep them
+                    if not self.question_answers[row]:
+                        self.question_rating[row] = prior
+                    self.question_prior[row] = prior
+                rows[pos] = row
+        return rows
+
+    def _student_row(self, student):
+        row = self.student_rows.get(student)
+        if row is None:
+            row = self.student_rows[student] = len(self.student_rows)
+            self.student_rating = _grow(self.student_rating, row + 1)
+            self.student_answers = _grow(self.student_answers, row + 1)
+        return row
+
+    def student_skill(self, student):
+        with self._lock:
+            row = self.student_rows.get(student)
+            return float(self.student_rating[row]) if row is not None else 0.0
+
+    def record(self, student, question_row, correct):
+        """Online update of both ratings after one answer"""
+        with self._lock:
+            student_row = self._student_row(student)
+            expected = 1.0 / (1.0 + math.exp(self.question_rating[question_row] - self.student_rating[student_row]))
+            error = float(correct) - expected
+            # Step sizes shrink as each side accumulates answers
+            self.student_rating[student_row] += max(RATING_K / math.sqrt(1 + self.student_answers[student_row]), RATING_MIN_K) * error
+            self.question_rating[question_row] -= max(RATING_K / math.sqrt(1 + self.question_answers[question_row]), RATING_MIN_K) * error
+            self.student_answers[student_row] += 1
+            self.question_answers[question_row] += 1
+
+            self.history = _grow(self.history, self.history_len + 1)
+            self.history[self.history_len] = (student_row, question_row, int(correct))
+            self.history_len += 1
+            self._since_calibration += 1
+            canonical_id = self.question_ids[question_row]
+            if self._since_calibration >= RECALIBRATE_EVERY and not self._calibrating:
+                self._calibrating = True
+                threading.Thread(target=self.recalibrate, name="rating-calibration", daemon=True).start()
+        if self.store is not None:
+            self.store.add(student, canonical_id, correct)
+
+    def _replay(self, attempts):
+        """Replace the in-memory history with a stored attempt log; call with the lock held"""
+        import numpy as np
+        students, canonical_ids, correct = zip(*attempts)
+        student_codes, question_codes = {}, {}
+        student_idx = [student_codes.setdefault(student, len(student_codes)) for student in students]
+        question_idx = [question_codes.setdefault(canonical_id, len(question_codes)) for canonical_id in canonical_ids]
+        student_rows = np.array([self._student_row(student) for student in student_codes], dtype=np.int32)
+        question_rows = np.array([self._question_row(canonical_id) for canonical_id in question_codes], dtype=np.int32)
+        self.history = np.column_stack((student_rows[student_idx], question_rows[question_idx],
+                                        np.array(correct, dtype=np.int32)))
+        self.history_len = len(self.history)
+        self.student_answers[:len(self.student_rows)] = np.bincount(self.history[:, 0], minlength=len(self.student_rows))
+        self.question_answers[:len(self.question_rows)] = np.bincount(self.history[:, 1], minlength=len(self.question_rows))
+
+    def recalibrate(self, iterations=25, prior_weight=1.0):
+        """Refit every rating to the attempt history with damped Newton steps"""
+        import numpy as np
+        try:
+            attempts = self.store.load() if self.store is not None else None
+            with self._lock:
+                if attempts:
+                    self._replay(attempts)
+                history = self.history[:self.history_len].copy()
+                n_students, n_questions = len(self.student_rows), len(self.question_rows)
+                theta = self.student_rating[:n_students].astype(np.float64)
+                difficulty = self.question_rating[:n_questions].astype(np.float64)
+                prior = self.question_prior[:n_questions].astype(np.float64)
+                self._since_calibration = 0
+            if not len(history):
+                return
+            students, rows, correct = history[:, 0], history[:, 1], history[:, 2]
+            for _ in range(iterations):
+                expected = 1.0 / (1.0 + np.exp(difficulty[rows] - theta[students]))
+                residual = correct - expected
+                information = expected * (1.0 - expected)
+                # Gaussian priors keep sparsely answered ratings near 0 (students) or their label (questions)
+                theta += ((np.bincount(students, residual, n_students) - prior_weight * theta)
+                          / (np.bincount(students, information, n_students) + prior_weight))
+                difficulty += ((-np.bincount(rows, residual, n_questions) - prior_weight * (difficulty - prior))
+                               / (np.bincount(rows, information, n_questions) + prior_weight))
+            with self._lock:
+                self.student_rating[:n_students] = theta
+                self.question_rating[:n_questions] = difficulty
+                self.version += 1
+        finally:
+            self._calibrating = False
+
+    def difficulty_label(self, question_row, fallback):
+        """Easy / Medium / Hard from the rating once enough students have answered"""
+        if self.question_answers[question_row] < CALIBRATED_ATTEMPTS:
+            return fallback
+        rating = self.question_rating[question_row]
+        return "Easy" if rating < -0.5 else "Hard" if rating > 0.5 else "Medium"
+
+@st.cache_resource
+def get_rating_engine():
+    """One rating engine shared by every session in this process, rebuilt from the stored answers"""
+    return RatingEngine(RatingStore())
+
+def _rating_bins(ratings):
+    import numpy as np
+    scaled = (np.asarray(ratings) + RATING_RANGE) / (2 * RATING_RANGE) * SELECTION_BINS
+    return np.clip(scaled.astype(np.int32), 0, SELECTION_BINS - 1)
+
+class AdaptiveSelector:
+    """A session's unanswered questions bucketed by rating, so picking the next one is O(bins)"""
+    def __init__(self, engine, rows, answered):
+        self.version = engine.version
+        self.bin_of = _rating_bins(engine.question_rating[rows])
+        self.bins = [set() for _ in range(SELECTION_BINS)]
+        for pos, bin_idx in enumerate(self.bin_of.tolist()):
+            if pos not in answered:
+                self.bins[bin_idx].add(pos)
+
+    def remove(self, pos):
+        self.bins[self.bin_of[pos]].discard(pos)
+
+    def pick(self, skill, exclude=None):
+        """Unanswered question nearest the difficulty the student should get right TARGET_SUCCESS of the time"""
+        target = int(_rating_bins(skill - math.log(TARGET_SUCCESS / (1 - TARGET_SUCCESS))))
+        for distance in range(SELECTION_BINS):
+            for bin_idx in {target - distance, target + distance}:
+                if 0 <= bin_idx < SELECTION_BINS:
+                    for pos in self.bins[bin_idx]:
+                        if pos != exclude:
+                            return pos
+        return None
+
+@st.cache_resource(max_entries=BANK_CACHE_ENTRIES, show_spinner=False)
+def _bank_rating_rows(bank_key, _questions):
+    return get_rating_engine().register(_questions)
+
+def get_rating_rows(questions):
+    """The current bank's rows in the rating engine, registered once per bank"""
+    return _bank_rating_rows(st.session_state.bank_key, questions)
+
+def get_adaptive_selector(questions):
+    """This session's selector, rebuilt after a recalibration moves the ratings"""
+    engine = get_rating_engine()
+    selector = st.session_state.adaptive_selector
+    hit = selector is not None and selector.version == engine.version
+    get_metrics().inc("pdfquiz_cache_requests_total", cache="adaptive_selector", result="hit" if hit else "miss")
+    if not hit:
+        answered = {pos for pos, q in enumerate(questions) if q['id'] in st.session_state.user_answers}
+        selector = st.session_state.adaptive_selector = AdaptiveSelector(engine, get_rating_rows(questions), answered)
+    return selector
+
+# Spaced repetition
+REVIEW_DB = os.path.join(DATA_DIR, "reviews.sqlite3")
+RELEARN_SECONDS = 10 * 60  # a missed card comes back within the same sitting
+DAY_SECONDS = 24 * 60 * 60
+REVIEW_GRADES = {"😓 Hard": 3, "🙂 Good": 4, "😎 Easy": 5}
+
+def sm2_schedule(easiness, interval, repetitions, quality):
+    """SM-2 update for one review graded 0-5, returning (easiness, interval days, repetitions)"""
+    if quality < 3:
+        repetitions, interval = 0, 0
+    else:
+        repetitions += 1
+        interval = 1 if repetitions == 1 else 6 if repetitions == 2 else round(interval * easiness)
+    easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return easiness, interval, repetitions
+
+class ReviewStore:
+    """SQLite persistence for review cards and each student's schedule"""
+    def __init__(self, path=REVIEW_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS review_cards (
+            card_id TEXT PRIMARY KEY, card TEXT NOT NULL)""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS review_items (
+            student TEXT NOT NULL, card_id TEXT NOT NULL, easiness REAL NOT NULL,
+            interval INTEGER NOT NULL, repetitions INTEGER NOT NULL, due REAL NOT NULL,
+            PRIMARY KEY (student, card_id)) WITHOUT ROWID""")
+
+    def add_cards(self, questions):
+        """Remember each question's content by card id so due cards from any bank can be shown"""
+        rows = [(q['card_id'], json.dumps({key: q[key] for key in ('question', 'options', 'correct_answer', 'ai_explanation')}))
+                for q in questions]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO review_cards VALUES (?, ?)", rows)
+            self._conn.execute("COMMIT")
+
+    def card(self, card_id):
+        with self._lock:
+            row = self._conn.execute("SELECT card FROM review_cards WHERE card_id = ?", (card_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load(self, student):
+        """A student's whole schedule as card id -> (easiness, interval, repetitions, due)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT card_id, easiness, interval, repetitions, due FROM review_items "
+                                      "WHERE student = ?", (student,)).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def save(self, student, card_id, item):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO review_items VALUES (?, ?, ?, ?, ?, ?)",
+                               (student, card_id) + tuple(item))
+
+@st.cache_resource
+def get_review_store():
+    """One review database connection shared by every session in this process"""
+    return ReviewStore()
+
+class ReviewQueue:
+    """A student's review schedule with a due-ordered heap; superseded heap entries are skipped lazily"""
+    def __init__(self, student, items):
+        self.student = student
+        self.items = items
+        self.heap = [(item[3], card_id) for card_id, item in items.items()]
+        heapq.heapify(self.heap)
+
+    def _peek(self):
+        while self.heap:
+            due, card_id = self.heap[0]
+            if self.items[card_id][3] == due:
+                return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+    def next_due(self, now):
+        """Most overdue card, or None when nothing is due yet"""
+        top = self._peek()
+        return top[1] if top and top[0] <= now else None
+
+    def next_review_at(self):
+        top = self._peek()
+        return top[0] if top else None
+
+    def review(self, card_id, quality, now):
+        """Reschedule a card after a graded review and return its new state"""
+        easiness, interval, repetitions, _ = self.items.get(card_id, (2.5, 0, 0, now))
+        easiness, interval, repetitions = sm2_schedule(easiness, interval, repetitions, quality)
+        due = now + (interval * DAY_SECONDS if interval else RELEARN_SECONDS)
+        self.items[card_id] = (easiness, interval, repetitions, due)
+        heapq.heappush(self.heap, (due, card_id))
+        if len(self.heap) > 2 * len(self.items):
+            # Drop superseded entries once they outnumber live ones
+            self.heap = [(item[3], cid) for cid, item in self.items.items()]
+            heapq.heapify(self.heap)
+        return self.items[card_id]
+
+# Background parse queue
+class ParseJob:
+    """A queued PDF parse whose status and progress the UI can poll"""
+    def __init__(self, owner, name, data):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.name = name
+        self.data = data
+        self.size = len(data)
+        self.submitted = time.perf_counter()
+        self.order = None  # (size, arrival) heap key, set on submit
+        self.status = "queued"  # queued -> running -> done / failed, or cancelled
+        self.progress = 0.0
+        self.message = "Waiting for a free worker..."
+        self.notices = []
+        self.questions = None
+        self.error = None
+        self.profile_dir = None  # set when an operator asked to profile this parse
+        self.profile_report = {}
+
+    def report(self, fraction, message):
+        self.progress = min(max(fraction, 0.0), 1.0)
+        self.message = message
+
+    def notify(self, level, message):
+        # Worker threads have no script context, so keep messages for the UI to replay
+        if (level, message) not in self.notices:
+            self.notices.append((level, message))
+
+PARSE_WORKER_NAME = "__pdf_parse_worker__"
+PARSE_WORKER_NICE = 19
+PARSE_JOB_TIMEOUT = 10 * 60  # seconds before a stuck parse is killed and its worker replaced
+
+def run_parse_worker(conn):
+    """Serve parse requests from a ParseJobQueue until the pipe closes, inside a worker process"""
+    if hasattr(os, "nice"):
+        os.nice(PARSE_WORKER_NICE)  # reruns get the CPU first when cores are scarce
+    import pdfplumber  # Load up front so the first job, and its profile, do not pay for it
+    metrics = threading.current_thread().metrics = Metrics()
+    progress = lambda fraction, message: conn.send(("progress", fraction, message))
+    notify = lambda level, message: conn.send(("notice", level, message))
+    while True:
+        try:
+            data, profile_dir = conn.recv()
+        except EOFError:
+            return
+        report = {}
+        try:
+            with Profiler(profile_dir).profile("parse", report) if profile_dir else contextlib.nullcontext():
+                questions = parse_pdf_content(io.BytesIO(data), progress=progress, notify=notify)
+            result = ("done", questions)
+        except Exception as e:
+            result = ("failed", str(e))
+        conn.send(result + (report, metrics.drain()))
+
+class ParseJobQueue:
+    """Fixed pool of worker processes that parse PDFs away from the script threads, smallest file first.
+
+    pdfplumber is CPU-bound pure Python, so parsing in threads of the app
+    process would hold the GIL against every session's reruns. Priority and
+    admission stay here; each worker thread feeds one process over a pipe.
+    """
+    def __init__(self, workers=2, max_pending=16, per_user=1, metrics=None):
+        self.metrics = metrics or Metrics()
+        self.max_pending = max_pending
+        self.per_user = per_user
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = {}  # owner -> queued + running jobs
+        self._cond = threading.Condition()
+        for n in range(workers):
+            threading.Thread(target=self._work, name=f"pdf-parse-{n}", daemon=True).start()
+
+    def submit(self, owner, name, data, profiler=None):
+        """Queue a parse, or return (None, reason) when admission is refused"""
+        with self._cond:
+            if self._active.get(owner, 0) >= self.per_user:
+                self.metrics.inc("pdfquiz_parse_jobs_total", status="rejected")
+                return None, "⏳ You already have a PDF being processed. Please wait for it to finish."
+            if len(self._heap) >= self.max_pending:
+                self.metrics.inc("pdfquiz_parse_jobs_total", status="rejected")
+                return None, "🚦 The server is busy processing other uploads. Please try again in a minute."
+            job = ParseJob(owner, name, data)
+            job.profile_dir = profiler.directory if profiler else None
+            job.order = (job.size, next(self._seq))
+            heapq.heappush(self._heap, (job.order, job))
+            self._active[owner] = self._active.get(owner, 0) + 1
+            self._cond.notify()
+        return job, None
+
+    def cancel(self, job):
+        """Drop a job that has not started yet; running jobs finish normally"""
+        with self._cond:
+            if job.status == "queued":
+                job.status = "cancelled"
+                self.metrics.inc("pdfquiz_parse_jobs_total", status="cancelled")
+                job.data = None
+                self._release(job.owner)
+                # Free its slot right away so it no longer counts against max_pending
+                self._heap = [entry for entry in self._heap if entry[1] is not job]
+                heapq.heapify(self._heap)
+
+    def position(self, job):
+        """Number of queued jobs that will run before this one"""
+        with self._cond:
+            return sum(1 for order, _ in self._heap if order < job.order)
+
+    def _release(self, owner):
+        self._active[owner] -= 1
+        if not self._active[owner]:
+            del self._active[owner]
+
+    def _spawn(self):
+        """Start a worker process that loads this file and serves parses over a pipe"""
+        import multiprocessing
+        ours, theirs = multiprocessing.Pipe()
+        # Streamlit does not run the script as an importable module, so the worker re-runs the file itself
+        process = multiprocessing.get_context("spawn").Process(
+            target=runpy.run_path, args=(os.path.abspath(__file__),),
+            kwargs={"run_name": PARSE_WORKER_NAME, "init_globals": {"PARSE_WORKER_CONN": theirs}},
+            name="pdf-parse-worker", daemon=True)
+        process.start()
+        theirs.close()
+        return process, ours
+
+    def _work(self):
+        process = conn = None
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, job = heapq.heappop(self._heap)
+                job.status = "running"
+                job.message = "Starting..."
+            self.metrics.observe("pdfquiz_parse_wait_seconds", time.perf_counter() - job.submitted)
+            try:
+                if process is None or not process.is_alive():
+                    process, conn = self._spawn()
+                conn.send((job.data, job.profile_dir))
+                deadline = time.monotonic() + PARSE_JOB_TIMEOUT
+                while True:
+                    if not conn.poll(max(deadline - time.monotonic(), 0)):
+                        raise TimeoutError
+                    kind, *payload = conn.recv()
+                    if kind == "progress":
+                        job.report(*payload)
+                    elif kind == "notice":
+                        job.notify(*payload)
+                    else:
+                        value, job.profile_report, worker_metrics = payload
+                        self.metrics.merge(*worker_metrics)
+                        if kind == "done":
+                            job.questions = value
+                        else:
+                            job.error = value
+                        job.status = kind
+                        break
+            except (EOFError, OSError) as e:
+                if isinstance(e, TimeoutError):
+                    job.error = f"Processing took longer than {PARSE_JOB_TIMEOUT // 60} minutes and was stopped"
+                else:
+                    job.error = "The PDF worker stopped unexpectedly"
+                job.status = "failed"
+                if process is not None:
+                    process.kill()  # a fresh worker is spawned for the next job
+                    process.join()
+                    conn.close()
+                process = None
+            finally:
+                job.data = None
+                self.metrics.inc("pdfquiz_parse_jobs_total", status=job.status)
+                with self._cond:
+                    self._release(job.owner)
+
+@st.cache_resource
+def get_parse_queue():
+    """One parse queue shared by every session in this process"""
+    return ParseJobQueue(metrics=get_metrics())
+
+@st.fragment(run_every=1)
+def render_parse_status(job):
+    """Poll a background parse without rerunning the whole page"""
+    if job.status in ("queued", "running"):
+        if job.status == "queued":
+            ahead = get_parse_queue().position(job)
+            st.info(f"🕒 Queued for processing ({ahead} upload{'s' if ahead != 1 else ''} ahead of yours)")
+        st.progress(job.progress, text=f"🔍 Processing PDF with AI Analysis... {job.message}")
+    else:
+        st.rerun()
+
+# Session persistence
+SESSION_STORE_URL = os.environ.get("PDF_QUIZ_SESSION_STORE", "")  # "" for local SQLite, or redis://host:port/db
+SESSION_DB = os.path.join(DATA_DIR, "sessions.sqlite3")
+SESSION_TTL = 7 * DAY_SECONDS
+SESSION_FLUSH_SECONDS = 0.5
+SESSION_SWEEP_SECONDS = 60 * 60  # how often expired sessions and unused banks are deleted
+# Progress that must survive a restart or a move to another app process; answers are stored separately
+SESSION_FIELDS = ['current_q', 'marked_review', 'start_time', 'question_start_time', 'quiz_mode', 'quiz_started',
+                  'quiz_completed', 'quiz_results', 'question_times', 'user_profile', 'uploaded_file', 'bank_key', 'student_name',
+                  'adaptive_practice', 'current_view', 'view_type', 'sound_enabled']
+
+class SQLiteSessionStore:
+    """Session store in a local SQLite file, a stand-in for Redis on single-host deployments"""
+    def __init__(self, path=SESSION_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, meta TEXT NOT NULL, updated REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS session_answers (
+            session_id TEXT NOT NULL, question_id INTEGER NOT NULL, answer TEXT NOT NULL,
+            PRIMARY KEY (session_id, question_id)) WITHOUT ROWID""")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS banks (bank_key TEXT PRIMARY KEY, questions BLOB NOT NULL, updated REAL NOT NULL)")
+        if "updated" not in {row[1] for row in self._conn.execute("PRAGMA table_info(banks)")}:
+            # Stores written before banks were swept have no timestamps; their unused banks go on the first sweep
+            self._conn.execute("ALTER TABLE banks ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+
+    def write_batch(self, metas, answers, banks):
+        """Apply one flush worth of changes in a single transaction"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO banks VALUES (?, ?, ?) ON CONFLICT (bank_key) DO UPDATE SET updated = excluded.updated",
+                                       [(key, payload, now) for key, payload in banks.items()])
+                self._conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                                       [(sid, meta, now) for sid, meta in metas.items()])
+                for sid, overlay in answers.items():
+                    self._conn.executemany("INSERT OR REPLACE INTO session_answers VALUES (?, ?, ?)",
+                                           [(sid, qid, answer) for qid, answer in overlay.items() if answer is not None])
+                    self._conn.executemany("DELETE FROM session_answers WHERE session_id = ? AND question_id = ?",
+                                           [(sid, qid) for qid, answer in overlay.items() if answer is None])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def sweep(self):
+        """Delete expired sessions with their answers, then banks that no remaining session uses"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM session_answers WHERE session_id IN "
+                                   "(SELECT session_id FROM sessions WHERE updated < ?)", (now - SESSION_TTL,))
+                self._conn.execute("DELETE FROM sessions WHERE updated < ?", (now - SESSION_TTL,))
+                # Recently written banks are kept, their session's meta may not be flushed yet
+                self._conn.execute("""DELETE FROM banks WHERE updated < ? AND bank_key NOT IN (
+                    SELECT json_extract(meta, '$.bank_key') FROM sessions WHERE json_extract(meta, '$.bank_key') IS NOT NULL)""",
+                                   (now - SESSION_SWEEP_SECONDS,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, session_id):
+        """(meta JSON or None, {question id: answer}) for a session"""
+        with self._lock:
+            row = self._conn.execute("SELECT meta FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            answers = self._conn.execute("SELECT question_id, answer FROM session_answers WHERE session_id = ?",
+                                         (session_id,)).fetchall()
+        return (row[0] if row else None), dict(answers)
+
+    def load_bank(self, bank_key):
+        with self._lock:
+            row = self._conn.execute("SELECT questions FROM banks WHERE bank_key = ?", (bank_key,)).fetchone()
+        return row[0] if row else None
+
+class RedisSessionStore:
+    """Session store in Redis, so several app processes or hosts can share sessions"""
+    def __init__(self, url):
+        import redis  # Optional dependency, only needed for multi-host deployments
+        self._redis = redis.Redis.from_url(url)
+
+    def write_batch(self, metas, answers, banks):
+        pipe = self._redis.pipeline(transaction=False)
+        for bank_key, payload in banks.items():
+            pipe.set(f"quiz:bank:{bank_key}", payload, nx=True, ex=SESSION_TTL)
+        for sid, meta in metas.items():
+            pipe.set(f"quiz:session:{sid}:meta", meta, ex=SESSION_TTL)
+            # A bank lives as long as the last session that uses it
+            bank_key = json.loads(meta).get('bank_key')
+            if bank_key:
+                pipe.expire(f"quiz:bank:{bank_key}", SESSION_TTL)
+        for sid, overlay in answers.items():
+            key = f"quiz:session:{sid}:answers"
+            written = {qid: answer for qid, answer in overlay.items() if answer is not None}
+            removed = [qid for qid, answer in overlay.items() if answer is None]
+            if written:
+                pipe.hset(key, mapping=written)
+            if removed:
+                pipe.hdel(key, *removed)
+            pipe.expire(key, SESSION_TTL)
+        pipe.execute()
+
+    def load(self, session_id):
+        meta = self._redis.get(f"quiz:session:{session_id}:meta")
+        answers = self._redis.hgetall(f"quiz:session:{session_id}:answers")
+        return (meta.decode() if meta else None), {int(qid): answer.decode() for qid, answer in answers.items()}
+
+    def load_bank(self, bank_key):
+        return self._redis.get(f"quiz:bank:{bank_key}")
+
+    def sweep(self):
+        pass  # Redis expires sessions and banks itself
+
+class SessionWriter:
+    """Write-behind buffer: reruns queue changes, a background thread flushes them in batches"""
+    def __init__(self, store, interval=SESSION_FLUSH_SECONDS):
+        self.store = store
+        self._lock = threading.Lock()
+        self._metas = {}  # session id -> latest meta JSON
+        self._answers = {}  # session id -> {question id: answer, or None to delete}
+        self._banks = {}  # bank key -> compressed questions JSON
+        threading.Thread(target=self._run, args=(interval,), name="session-writer", daemon=True).start()
+        atexit.register(self.flush)
+
+    def put(self, session_id, meta=None, answers=None, bank=None):
+        with self._lock:
+            if meta is not None:
+                self._metas[session_id] = meta
+            if answers:
+                self._answers.setdefault(session_id, {}).update(answers)
+            if bank is not None:
+                self._banks[bank[0]] = bank[1]
+
+    def flush(self):
+        with self._lock:
+            metas, answers, banks = self._metas, self._answers, self._banks
+            self._metas, self._answers, self._banks = {}, {}, {}
+        if not (metas or answers or banks):
+            return
+        try:
+            self.store.write_batch(metas, answers, {key: zlib.compress(payload) for key, payload in banks.items()})
+        except Exception:
+            # Keep the batch for the next flush, without overwriting anything newer
+            with self._lock:
+                for sid, meta in metas.items():
+                    self._metas.setdefault(sid, meta)
+                for sid, overlay in answers.items():
+                    self._answers[sid] = {**overlay, **self._answers.get(sid, {})}
+                for key, payload in banks.items():
+                    self._banks.setdefault(key, payload)
+
+    def _run(self, interval):
+        last_sweep = 0
+        while True:
+            time.sleep(interval)
+            self.flush()
+            if time.time() - last_sweep >= SESSION_SWEEP_SECONDS:
+                last_sweep = time.time()
+                try:
+                    self.store.sweep()
+                except Exception:
+                    logging.getLogger(__name__).exception("Session store sweep failed")
+
+@st.cache_resource
+def get_session_writer():
+    """One session store and write-behind buffer per process"""
+    store = RedisSessionStore(SESSION_STORE_URL) if SESSION_STORE_URL.startswith("redis") else SQLiteSessionStore()
+    return SessionWriter(store)
+
+def _session_meta():
+    meta = {field: st.session_state[field] for field in SESSION_FIELDS}
+    meta['marked_review'] = sorted(meta['marked_review'])
+    return json.dumps(meta, sort_keys=True)
+
+def sync_session_state():
+    """Queue whatever this run changed: the meta blob if it differs, and only the answers that changed"""
+    if 'synced_answers' not in st.session_state:
+        return
+    writer = get_session_writer()
+    sid = st.session_state.session_id
+    meta = _session_meta()
+    if meta != st.session_state.synced_meta:
+        writer.put(sid, meta=meta)
+        st.session_state.synced_meta = meta
+    current, synced = st.session_state.user_answers, st.session_state.synced_answers
+    overlay = {qid: answer for qid, answer in current.items() if synced.get(qid) != answer}
+    overlay.update({qid: None for qid in synced.keys() - current.keys()})
+    if overlay:
+        writer.put(sid, answers=overlay)
+        st.session_state.synced_answers = dict(current)
+
+def restore_session_state():
+    """Resume this browser's session from the shared store after a restart or on another process"""
+    writer = get_session_writer()
+    meta, answers = writer.store.load(st.session_state.session_id)
+    if meta:
+        for field, value in json.loads(meta).items():
+            st.session_state[field] = value
+        st.session_state.marked_review = set(st.session_state.marked_review)
+        st.session_state.user_answers = answers
+        payload = writer.store.load_bank(st.session_state.bank_key) if st.session_state.bank_key else None
+        if payload:
+            install_bank(json.loads(zlib.decompress(payload)), st.session_state.uploaded_file, st.session_state.bank_key)
+            st.session_state.resumed = True
+    st.session_state.synced_meta = meta or ""
+    st.session_state.synced_answers = dict(answers) if meta else {}
+
+def install_bank(questions, file_name, bank_key):
+    """Index a question bank for this session without touching quiz progress; returns near-duplicate count"""
+    st.session_state.bank_key = bank_key
+    duplicates = get_duplicate_index().register_bank(bank_key, file_name, questions)
+    get_rating_rows(questions)
+    st.session_state.adaptive_selector = None
+    get_review_store().add_cards(questions)
+    st.session_state.review_card = None
+    st.session_state.exam_permutation = None
+    st.session_state.questions = questions
+    st.session_state.uploaded_file = file_name
+    return duplicates
+
+def start_new_bank(questions, file_name):
+    """Install a freshly loaded question bank and reset the quiz for it"""
+    # Banks are stored once by content so any app process can resume sessions on them
+    payload = json.dumps(questions).encode()
+    bank_key = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    duplicates = install_bank(questions, file_name, bank_key)
+    if duplicates:
+        within = sum(1 for q in questions if q['duplicate_of'] and q['duplicate_of'][0] == file_name)
+        st.info(f"🔁 {duplicates} question{'s look' if duplicates != 1 else ' looks'} like near-duplicates "
+                f"of questions already loaded ({within} within this file)")
+    get_session_writer().put(st.session_state.session_id, bank=(bank_key, payload))
+    st.session_state.resumed = False
+    # Reset quiz state when new file is uploaded
+    st.session_state.user_answers = {}
+    st.session_state.current_q = first_question(questions)
+    st.session_state.quiz_completed = False
+    st.session_state.quiz_results = None
+    st.session_state.results_figure = None
+    st.session_state.question_times = []
+    st.session_state.quiz_started = True
+    st.session_state.start_time = time.time()
+    st.session_state.question_start_time = time.time()
+
+# Per-student exam order
+OPTION_PERMUTATIONS = {n: list(itertools.permutations(range(n))) for n in range(1, len(OPTION_LETTERS) + 1)}
+
+class ExamPermutation:
+    """A student's question and option order as index arrays over the shared question list"""
+    def __init__(self, seed, size):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.order = rng.permutation(size).astype(np.int32)  # display position -> question index
+        self.position = np.empty(size, dtype=np.int32)  # question index -> display position
+        self.position[self.order] = np.arange(size, dtype=np.int32)
+        # One byte per question picks among the (at most 5!) orderings of its options
+        self.option_codes = rng.integers(0, len(OPTION_PERMUTATIONS[len(OPTION_LETTERS)]), size, dtype=np.uint8)
+
+def get_exam_permutation(questions):
+    """This session's exam order, or None outside exam mode where questions keep their original order"""
+    if st.session_state.quiz_mode != "exam":
+        return None
+    perm = st.session_state.exam_permutation
+    hit = perm is not None and len(perm.order) == len(questions)
+    get_metrics().inc("pdfquiz_cache_requests_total", cache="exam_permutation", result="hit" if hit else "miss")
+    if not hit:
+        seed_text = f"{st.session_state.session_id}:{st.session_state.uploaded_file}"
+        seed = int.from_bytes(hashlib.blake2b(seed_text.encode(), digest_size=8).digest(), "big")
+        perm = st.session_state.exam_permutation = ExamPermutation(seed, len(questions))
+    return perm
+
+def display_index(perm, display_pos):
+    """Question index shown at a display position"""
+    return int(perm.order[display_pos]) if perm is not None else display_pos
+
+def display_position(perm, idx):
+    """Display position of a question index"""
+    return int(perm.position[idx]) if perm is not None else idx
+
+def display_options(perm, idx, options):
+    """Display letter -> original option letter, so answers are always stored by original letter"""
+    letters = list(options)
+    if perm is None:
+        return dict(zip(letters, letters))
+    orderings = OPTION_PERMUTATIONS[len(letters)]
+    ordering = orderings[perm.option_codes[idx] % len(orderings)]
+    return {OPTION_LETTERS[shown]: letters[original] for shown, original in enumerate(ordering)}
+
+def first_question(questions):
+    """Question index a fresh quiz starts on: the first of this session's exam order, or question 0"""
+    return display_index(get_exam_permutation(questions), 0)
+
+# Results
+def question_times():
+    """Seconds spent on each question of the current bank"""
+    if len(st.session_state.question_times) != len(st.session_state.questions):
+        st.session_state.question_times = [0.0] * len(st.session_state.questions)
+    return st.session_state.question_times
+
+def record_question_time():
+    """Credit the time since the last navigation to the current question and restart its clock"""
+    now = time.time()
+    if st.session_state.question_start_time and st.session_state.questions:
+        question_times()[st.session_state.current_q] += now - st.session_state.question_start_time
+    st.session_state.question_start_time = now
+
+def complete_quiz(questions, perm):
+    """Grade the quiz once, freeze the summary and apply the profile rewards exactly once"""
+    record_question_time()
+    times = question_times()
+    rows = []
+    for pos in range(len(questions)):
+        idx = display_index(perm, pos)
+        answer = st.session_state.user_answers.get(questions[idx]['id'])
+        rows.append({"position": pos + 1, "seconds": times[idx], "answered": answer is not None,
+                     "correct": answer == questions[idx]['correct_answer']})
+    correct_count = sum(row["correct"] for row in rows)
+    results = {
+        "correct": correct_count,
+        "total": len(questions),
+        "score_percent": correct_count / len(questions) * 100,
+        "total_time": time.time() - st.session_state.start_time,
+        "questions": rows,
+    }
+    
+    profile = st.session_state.user_profile
+    profile['total_quizzes'] += 1
+    profile['xp'] += correct_count * 5
+    if results['score_percent'] >= 90 and "Quiz Master" not in profile['achievements']:
+        profile['achievements'].append("Quiz Master")
+    
+    st.session_state.quiz_results = results
+    st.session_state.results_figure = None
+    st.session_state.quiz_completed = True
+    st.session_state.celebrate = True
+    return results
+
+def results_figure(results):
+    """The score gauge, built once per finished quiz"""
+    if st.session_state.results_figure is None:
+        import plotly.graph_objects as go  # Only the results screen draws charts
+        st.session_state.results_figure = go.Figure(go.Indicator(
+            mode = "gauge+number+delta",
+            value = results['score_percent'],
+            domain = {'x': [0, 1], 'y': [0, 1]},
+            title = {'text': "Performance Score"},
+            gauge = {
+                'axis': {'range': [None, 100]},
+                'bar': {'color': "darkblue"},
+                'steps': [
+                    {'range': [0, 50], 'color': "lightgray"},
+                    {'range': [50, 80], 'color': "gray"}],
+                'threshold': {
+                    'line': {'color': "red", 'width': 4},
+                    'thickness': 0.75,
+                    'value': 90}}))
+    return st.session_state.results_figure
+
+def format_duration(seconds):
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
+
+def render_review(questions):
+    """Spaced-repetition mode: due cards from any bank first, then unseen ones from this bank"""
+    store = get_review_store()
+    student = student_key()
+    queue = st.session_state.review_queue
+    if queue is None or queue.student != student:
+        queue = st.session_state.review_queue = ReviewQueue(student, store.load(student))
+        st.session_state.review_card = None
+    
+    card_id = st.session_state.review_card
+    if card_id is None:
+        card_id = queue.next_due(time.time())
+        if card_id is None:
+            card_id = next((q['card_id'] for q in questions if q['card_id'] not in queue.items), None)
+        if card_id is None:
+            next_at = queue.next_review_at()
+            wait = max(0, next_at - time.time()) if next_at else 0
+            st.success(f"🎉 All caught up! Next review in {int(wait // 3600)}h {int(wait % 3600 // 60)}m")
+            return
+        st.session_state.review_card = card_id
+        st.session_state.review_answer = None
+    
+    card = store.card(card_id)
+    answer = st.session_state.review_answer
+    st.caption(f"🗂️ {len(queue.items)} card{'s' if len(queue.items) != 1 else ''} in your review deck")
+    st.markdown(f"""
+    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 2rem; border-radius: 15px; margin-bottom: 1.5rem; color: white;">
+        <div style="font-size: 1.1rem; font-weight: 600; margin-bottom: 1rem;">🔁 Review</div>
+        <div style="font-size: 1.3rem; font-weight: 600; line-height: 1.6;">
+            {card['question']}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    for opt_letter, opt_text in card['options'].items():
+        if st.button(f"{opt_letter}) {opt_text}", key=f"review_{card_id}_{opt_letter}", use_container_width=True,
+                     type="primary" if answer == opt_letter else "secondary", disabled=answer is not None):
+            st.session_state.review_answer = opt_letter
+            autoplay_audio("correct" if opt_letter == card['correct_answer'] else "wrong")
+            st.rerun()
+    
+    if answer is None:
+        return
+    
+    # Grade the recall, then schedule the card and move on
+    if answer == card['correct_answer']:
+        st.success(f"🎉 Correct! Answer: {card['correct_answer']}. How hard was it to recall?")
+        grades = REVIEW_GRADES
+    else:
+        st.error(f"❌ Incorrect! Correct answer: {card['correct_answer']}")
+        grades = {"🔁 Again": 1}
+    grade_cols = st.columns(len(grades))
+    for col, (label, quality) in zip(grade_cols, grades.items()):
+        with col:
+            if st.button(label, key=f"grade_{quality}", use_container_width=True):
+                store.save(student, card_id, queue.review(card_id, quality, time.time()))
+                st.session_state.review_card = None
+                st.session_state.review_answer = None
+                st.rerun()
+
 def main():
+    timer = st.session_state.rerun_timer
+    timer.section("setup")
     st.set_page_config(
         page_title="PDF Quiz PRO", 
         page_icon="🚀",
@@ -481,6 +2182,7 @@ def main():
         'quiz_mode': "practice",
         'current_view': "question",
         'show_ai_explanation': {},
+        'show_full_figure': {},
         'marked_review': set(),
         'user_answers': {},
         'current_q': 0,
@@ -500,19 +2202,46 @@ def main():
         'sound_enabled': True,
         'question_start_time': None,
         'sidebar_open': False,
-        'view_type': 'grid'  # 'grid' or 'list'
+        'view_type': 'grid',  # 'grid' or 'list'
+        'parse_job': None,
+        'adaptive_selector': None,
+        'adaptive_practice': False,
+        'student_name': '',
+        'review_queue': None,
+        'review_card': None,
+        'review_answer': None,
+        'exam_permutation': None,
+        'uploaded_file': None,
+        'bank_key': None,
+        'resumed': False,
+        'question_times': [],  # seconds spent per question index, credited on navigation
+        'quiz_results': None,  # frozen when the quiz is finished
+        'results_figure': None,
+        'celebrate': False,  # set when the quiz is graded, so balloons show on that run only
+        'profile_target': None,  # "rerun" or "parse" while an operator's profile is pending
+        'profile_report': None
     }
     
     for key, value in default_states.items():
         if key not in st.session_state:
             st.session_state[key] = value
     
+    # The session id lives in the URL, so a reload or another app process finds the same session
+    if 'session_id' not in st.session_state:
+        session_id = st.query_params.get('session')
+        if not session_id:
+            session_id = uuid.uuid4().hex
+            st.query_params['session'] = session_id
+        st.session_state.session_id = session_id
+        restore_session_state()
+    
     # Handle sound toggle
     if st.query_params.get('toggle_sound'):
         st.session_state.sound_enabled = st.query_params.get('state') == 'true'
         st.rerun()
     
     # Sidebar Content (will be populated via JavaScript)
+    timer.section("sidebar")
     with st.sidebar:
         st.header("🎯 Quiz Mode")
         
@@ -525,8 +2254,15 @@ def main():
         with mode_col2:
             if st.button("📝 Exam", use_container_width=True,
                         type="primary" if st.session_state.quiz_mode == "exam" else "secondary"):
-                st.session_state.quiz_mode = "exam"
+                if st.session_state.quiz_mode != "exam":
+                    st.session_state.quiz_mode = "exam"
+                    if st.session_state.questions:
+                        st.session_state.current_q = first_question(st.session_state.questions)
                 st.rerun()
+        if st.button("🔁 Spaced Review", use_container_width=True,
+                    type="primary" if st.session_state.quiz_mode == "review" else "secondary"):
+            st.session_state.quiz_mode = "review"
+            st.rerun()
         
         st.markdown("---")
         st.header("👀 View Mode")
@@ -567,6 +2303,30 @@ def main():
             st.session_state.sound_enabled = not st.session_state.sound_enabled
             st.rerun()
         
+        # Adaptive practice picks the next question by difficulty instead of in order
+        adaptive_label = "🎯 Adaptive Practice On" if st.session_state.adaptive_practice else "➡️ Adaptive Practice Off"
+        if st.button(adaptive_label, use_container_width=True):
+            st.session_state.adaptive_practice = not st.session_state.adaptive_practice
+            st.rerun()
+        
+        st.text_input("👤 Student ID", key="student_name",
+                      help="Use the same ID to keep your spaced-review schedule across sessions")
+        
+        # Operator-only: profile one rerun or one PDF parse of this session
+        if is_operator():
+            with st.expander("🩺 Profiling"):
+                prof_col1, prof_col2 = st.columns(2)
+                with prof_col1:
+                    if st.button("Next rerun", use_container_width=True):
+                        st.session_state.profile_target = "rerun"
+                with prof_col2:
+                    if st.button("Next PDF parse", use_container_width=True):
+                        st.session_state.profile_target = "parse"
+                if st.session_state.profile_target:
+                    st.caption(f"⏺️ Profiling the next {st.session_state.profile_target}...")
+                if st.session_state.profile_report:
+                    render_profile_report(st.session_state.profile_report)
+        
         st.markdown("---")
         st.header("📊 Progress")
         
@@ -581,20 +2341,58 @@ def main():
             st.metric("Accuracy", f"{(correct/answered*100 if answered > 0 else 0):.1f}%")
     
     # Main content area
-    uploaded_file = st.file_uploader("📁 Upload PDF File", type="pdf", help="Upload a PDF file containing quiz questions")
+    timer.section("upload")
+    uploaded_file = st.file_uploader("📁 Upload PDF or Question Bank", type=["pdf"] + BANK_FILE_TYPES,
+                                     help="Upload a PDF with quiz questions, or a CSV / JSON Lines / XLSX question bank")
     
     if uploaded_file:
-        if not st.session_state.questions or st.session_state.get('uploaded_file') != uploaded_file.name:
-            with st.spinner("🔍 Processing PDF with AI Analysis..."):
-                st.session_state.questions = parse_pdf_content(uploaded_file)
-                st.session_state.uploaded_file = uploaded_file.name
-                # Reset quiz state when new file is uploaded
-                st.session_state.user_answers = {}
-                st.session_state.current_q = 0
-                st.session_state.quiz_completed = False
-                st.session_state.quiz_started = True
-                st.session_state.start_time = time.time()
-                st.session_state.question_start_time = time.time()
+        st.session_state.resumed = False
+    
+    if uploaded_file or st.session_state.resumed:
+        # A resumed session's bank came from the session store, so there may be no upload to handle
+        job = st.session_state.parse_job
+        if job is not None and uploaded_file is not None and job.name != uploaded_file.name:
+            # A different file was picked while the old one was still waiting
+            get_parse_queue().cancel(job)
+            job = st.session_state.parse_job = None
+        
+        if uploaded_file is not None and job is None and st.session_state.get('uploaded_file') != uploaded_file.name:
+            is_pdf = uploaded_file.name.lower().endswith(".pdf")
+            if not is_pdf:
+                # Structured banks are read directly, no text extraction needed
+                try:
+                    bank_questions, problems = import_question_bank(uploaded_file, uploaded_file.name)
+                except Exception as e:
+                    st.error(f"Error importing question bank: {str(e)}")
+                    bank_questions, problems = [], []
+                for problem in problems:
+                    st.warning(problem)
+                start_new_bank(bank_questions, uploaded_file.name)
+            else:
+                # Parse on the background workers so other sessions stay responsive
+                profiler = get_profiler() if st.session_state.profile_target == "parse" else None
+                job, reason = get_parse_queue().submit(st.session_state.session_id, uploaded_file.name,
+                                                       uploaded_file.getvalue(), profiler=profiler)
+                if job is None:
+                    st.warning(reason)
+                    return
+                if profiler:
+                    st.session_state.profile_target = None
+                st.session_state.parse_job = job
+        
+        if job is not None:
+            if job.status in ("queued", "running"):
+                render_parse_status(job)
+                return
+            
+            st.session_state.parse_job = None
+            if job.profile_report:
+                st.session_state.profile_report = job.profile_report
+            for level, message in job.notices:
+                st_notify(level, message)
+            if job.status == "failed":
+                st.error(f"Error processing PDF: {job.error}")
+            start_new_bank(job.questions or [], uploaded_file.name)
         
         questions = st.session_state.questions
         
@@ -605,12 +2403,21 @@ def main():
             - Questions should start with 'Q1.', 'Q2.', etc.
             - Options should be labeled A), B), C), D)
             - Answers should be marked with 'Answer: A' format
+            
+            **Question banks (CSV / JSON Lines / XLSX)** need `question` and `answer` columns,
+            options in `A`-`E` columns (or one `options` column), and an optional `difficulty`.
             """)
             return
         
         st.success(f"✅ Found {len(questions)} questions! + 🤖 AI Explanations Ready")
         
+        if st.session_state.quiz_mode == "review":
+            timer.section("review")
+            render_review(questions)
+            return
+        
         # Timer Display
+        timer.section("timers")
         if st.session_state.quiz_mode == "exam":
             remaining_time = max(0, 3600 - (time.time() - st.session_state.start_time))
             minutes = int(remaining_time // 60)
@@ -647,7 +2454,13 @@ def main():
             </div>
             """, unsafe_allow_html=True)
         
+        # Exams show each student their own order; state is always kept by question index
+        perm = get_exam_permutation(questions)
+        if perm is not None:
+            st.caption("🔀 Question and option order is shuffled for this exam")
+        
         # Quick Jump Grid
+        timer.section("navigation")
         st.subheader("🎯 Quick Navigation")
         
         # Create grid with 10 questions per row
@@ -655,28 +2468,30 @@ def main():
         
         for row in range(rows):
             cols = st.columns(10)
-            start_idx = row * 10
-            end_idx = min(start_idx + 10, len(questions))
+            start_pos = row * 10
+            end_pos = min(start_pos + 10, len(questions))
             
-            for idx in range(start_idx, end_idx):
-                with cols[idx % 10]:
+            for pos in range(start_pos, end_pos):
+                idx = display_index(perm, pos)
+                with cols[pos % 10]:
                     is_answered = questions[idx]['id'] in st.session_state.user_answers
                     is_current = idx == st.session_state.current_q
                     is_marked = idx in st.session_state.marked_review
                     
-                    btn_text = f"Q{idx+1}"
+                    btn_text = f"Q{pos+1}"
                     if is_marked:
-                        btn_text = f"📌{idx+1}"
+                        btn_text = f"📌{pos+1}"
                     
                     button_type = "primary" if is_current else "secondary"
                     if st.button(btn_text, key=f"jump_{idx}", use_container_width=True, type=button_type):
+                        record_question_time()
                         st.session_state.current_q = idx
-                        st.session_state.question_start_time = time.time()
                         st.rerun()
         
         # Display based on view mode
         if st.session_state.current_view == "grid":
             # OVERVIEW VIEW (Grid or List)
+            timer.section("overview")
             st.subheader("🔲 Questions Overview")
             
             # View type toggle
@@ -692,14 +2507,29 @@ def main():
                     st.session_state.view_type = 'list'
                     st.rerun()
             
+            # Search only renders the matching questions
+            query = st.text_input("🔎 Search questions", key="overview_query",
+                                  placeholder="Search question and option text...")
+            if query.strip():
+                search_start = time.perf_counter()
+                visible, total = get_search_index(questions).search(query)
+                search_ms = (time.perf_counter() - search_start) * 1000
+                get_metrics().observe("pdfquiz_span_seconds", search_ms / 1000, span="search")
+                st.caption(f"{total} matching question{'s' if total != 1 else ''} ({search_ms:.1f} ms)"
+                           + (f", showing the top {MAX_SEARCH_RESULTS}" if total > MAX_SEARCH_RESULTS else ""))
+            else:
+                visible = [display_index(perm, pos) for pos in range(len(questions))]
+            
             if st.session_state.view_type == 'grid':
                 # BUBBLE GRID VIEW
                 st.markdown('<div class="grid-view-container">', unsafe_allow_html=True)
                 
-                # Display all questions in bubble grid
+                # Display questions in bubble grid
                 cols = st.columns(4)
-                for idx, question in enumerate(questions):
-                    col_idx = idx % 4
+                for slot, idx in enumerate(visible):
+                    question = questions[idx]
+                    pos = display_position(perm, idx)
+                    col_idx = slot % 4
                     with cols[col_idx]:
                         is_answered = question['id'] in st.session_state.user_answers
                         is_current = idx == st.session_state.current_q
@@ -719,15 +2549,15 @@ def main():
                         
                         st.markdown(f"""
                         <div class="{bubble_class}" onclick="selectQuestion({idx})">
-                            <div class="question-number">Q{idx+1}</div>
+                            <div class="question-number">Q{pos+1}</div>
                             <div class="question-status">{status}</div>
                         </div>
                         """, unsafe_allow_html=True)
                         
-                        if st.button(f"Open Q{idx+1}", key=f"bubble_{idx}", use_container_width=True):
+                        if st.button(f"Open Q{pos+1}", key=f"bubble_{idx}", use_container_width=True):
+                            record_question_time()
                             st.session_state.current_q = idx
                             st.session_state.current_view = "question"
-                            st.session_state.question_start_time = time.time()
                             st.rerun()
                 
                 st.markdown('</div>', unsafe_allow_html=True)
@@ -736,7 +2566,9 @@ def main():
                 # LIST VIEW
                 st.markdown('<div class="list-view-container">', unsafe_allow_html=True)
                 
-                for idx, question in enumerate(questions):
+                for idx in visible:
+                    question = questions[idx]
+                    pos = display_position(perm, idx)
                     is_answered = question['id'] in st.session_state.user_answers
                     is_current = idx == st.session_state.current_q
                     is_marked = idx in st.session_state.marked_review
@@ -755,7 +2587,7 @@ def main():
                     
                     st.markdown(f"""
                     <div class="{item_class}" onclick="selectQuestion({idx})">
-                        <div style="font-weight: bold; min-width: 50px;">Q{idx+1}</div>
+                        <div style="font-weight: bold; min-width: 50px;">Q{pos+1}</div>
                         <div style="min-width: 30px;">{status_icon}</div>
                         <div class="question-preview">
                             {question['question'][:100]}...
@@ -764,42 +2596,81 @@ def main():
                     """, unsafe_allow_html=True)
                     
                     if st.button(f"Open", key=f"list_{idx}", use_container_width=True):
+                        record_question_time()
                         st.session_state.current_q = idx
                         st.session_state.current_view = "question"
-                        st.session_state.question_start_time = time.time()
                         st.rerun()
                 
                 st.markdown('</div>', unsafe_allow_html=True)
                 
         else:
             # QUESTION VIEW
+            timer.section("question")
             if not st.session_state.quiz_completed:
                 current_q = questions[st.session_state.current_q]
                 current_answer = st.session_state.user_answers.get(current_q['id'])
+                current_pos = display_position(perm, st.session_state.current_q)
+                option_letters = display_options(perm, st.session_state.current_q, current_q['options'])
+                shown_letter = {original: shown for shown, original in option_letters.items()}
                 
                 # Question Display
                 st.markdown(f"""
                 <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 2rem; border-radius: 15px; margin-bottom: 1.5rem; color: white;">
-                    <div style="font-size: 1.1rem; font-weight: 600; margin-bottom: 1rem;">Question {st.session_state.current_q + 1} of {len(questions)}</div>
+                    <div style="font-size: 1.1rem; font-weight: 600; margin-bottom: 1rem;">Question {current_pos + 1} of {len(questions)}</div>
                     <div style="font-size: 1.3rem; font-weight: 600; line-height: 1.6;">
                         {current_q['question']}
                     </div>
                 </div>
                 """, unsafe_allow_html=True)
                 
+                # Near-duplicate and pooled attempt info
+                if current_q['duplicate_of']:
+                    dup_bank, dup_id = current_q['duplicate_of']
+                    where = "this file" if dup_bank == st.session_state.uploaded_file else dup_bank
+                    st.caption(f"🔁 Near-duplicate of Q{dup_id} in {where}")
+                attempts, correct_attempts = get_duplicate_index().attempt_stats(current_q['canonical_id'])
+                if attempts:
+                    st.caption(f"📊 Answered correctly in {correct_attempts / attempts * 100:.0f}% of {attempts} "
+                               f"attempt{'s' if attempts != 1 else ''} across all banks")
+                
+                # Figures: thumbnails by default, full resolution only when asked for
+                if current_q['figures']:
+                    fig_cols = st.columns(min(len(current_q['figures']), 3))
+                    for fig_idx, figure_key in enumerate(current_q['figures']):
+                        with fig_cols[fig_idx % 3]:
+                            show_full = st.session_state.show_full_figure.get(figure_key, False)
+                            figure_data = cached("figure", load_figure, figure_key, thumbnail=not show_full)
+                            if figure_data:
+                                st.image(figure_data)
+                            else:
+                                st.caption("🖼️ Figure unavailable")
+                            if st.button("🔽 Thumbnail" if show_full else "🔍 Full Size",
+                                         key=f"figure_{current_q['id']}_{fig_idx}", use_container_width=True):
+                                st.session_state.show_full_figure[figure_key] = not show_full
+                                st.rerun()
+                
                 # Options
                 selected_option = None
-                for opt_letter, opt_text in current_q['options'].items():
+                for display_letter, opt_letter in option_letters.items():
+                    opt_text = current_q['options'][opt_letter]
                     is_selected = current_answer == opt_letter
                     if is_selected:
                         selected_option = opt_letter
                     
                     if st.button(
-                        f"{opt_letter}) {opt_text}",
+                        f"{display_letter}) {opt_text}",
                         key=f"opt_{current_q['id']}_{opt_letter}",
                         use_container_width=True,
                         type="primary" if is_selected else "secondary"
                     ):
+                        if current_q['id'] not in st.session_state.user_answers:
+                            # Only first answers count towards the pooled statistics and ratings
+                            is_correct = opt_letter == current_q['correct_answer']
+                            get_duplicate_index().record_attempt(current_q['canonical_id'], is_correct)
+                            get_rating_engine().record(student_key(),
+                                                       get_rating_rows(questions)[st.session_state.current_q], is_correct)
+                            if st.session_state.adaptive_selector is not None:
+                                st.session_state.adaptive_selector.remove(st.session_state.current_q)
                         st.session_state.user_answers[current_q['id']] = opt_letter
                         # Check answer and play sound
                         if st.session_state.quiz_mode == "practice":
@@ -824,10 +2695,10 @@ def main():
                     st.markdown(f"""
                     <div class="ai-explanation">
                         <h4>🧠 AI Analysis</h4>
-                        {current_q['ai_explanation']}
+                        {current_q['ai_explanation'] if perm is None else generate_ai_explanation(current_q['question'], shown_letter[current_q['correct_answer']], current_q['options'])}
                         
                         <div style="margin-top: 1rem; padding: 1rem; background: rgba(255,255,255,0.1); border-radius: 8px;">
-                            <strong>💡 Pro Tip:</strong> This question is rated <strong>{current_q['difficulty']}</strong> difficulty. 
+                            <strong>💡 Pro Tip:</strong> This question is rated <strong>{get_rating_engine().difficulty_label(get_rating_rows(questions)[st.session_state.current_q], current_q['difficulty'])}</strong> difficulty. 
                         </div>
                     </div>
                     """, unsafe_allow_html=True)
@@ -837,10 +2708,10 @@ def main():
                     # Exam navigation
                     exam_col1, exam_col2, exam_col3 = st.columns(3)
                     with exam_col1:
-                        if st.button("⏮️ Previous", use_container_width=True, disabled=st.session_state.current_q == 0):
-                            if st.session_state.current_q > 0:
-                                st.session_state.current_q -= 1
-                                st.session_state.question_start_time = time.time()
+                        if st.button("⏮️ Previous", use_container_width=True, disabled=current_pos == 0):
+                            if current_pos > 0:
+                                record_question_time()
+                                st.session_state.current_q = display_index(perm, current_pos - 1)
                                 st.rerun()
                     with exam_col2:
                         mark_text = "📌 Mark" if st.session_state.current_q not in st.session_state.marked_review else "✅ Unmark"
@@ -851,13 +2722,13 @@ def main():
                                 st.session_state.marked_review.add(st.session_state.current_q)
                             st.rerun()
                     with exam_col3:
-                        next_text = "💾 Save & Next" if st.session_state.current_q < len(questions) - 1 else "🏁 Finish Exam"
+                        next_text = "💾 Save & Next" if current_pos < len(questions) - 1 else "🏁 Finish Exam"
                         if st.button(next_text, use_container_width=True, type="primary"):
-                            if st.session_state.current_q < len(questions) - 1:
-                                st.session_state.current_q += 1
-                                st.session_state.question_start_time = time.time()
+                            if current_pos < len(questions) - 1:
+                                record_question_time()
+                                st.session_state.current_q = display_index(perm, current_pos + 1)
                             else:
-                                st.session_state.quiz_completed = True
+                                complete_quiz(questions, perm)
                             st.rerun()
                 else:
                     # Practice navigation
@@ -865,18 +2736,23 @@ def main():
                     with practice_col1:
                         if st.button("◀ Previous", use_container_width=True, disabled=st.session_state.current_q == 0):
                             if st.session_state.current_q > 0:
+                                record_question_time()
                                 st.session_state.current_q -= 1
-                                st.session_state.question_start_time = time.time()
                                 st.rerun()
                     with practice_col2:
-                        if st.session_state.current_q < len(questions) - 1:
+                        if st.session_state.adaptive_practice:
+                            skill = get_rating_engine().student_skill(student_key())
+                            next_q = get_adaptive_selector(questions).pick(skill, exclude=st.session_state.current_q)
+                        else:
+                            next_q = st.session_state.current_q + 1 if st.session_state.current_q < len(questions) - 1 else None
+                        if next_q is not None:
                             if st.button("Next ▶", use_container_width=True):
-                                st.session_state.current_q += 1
-                                st.session_state.question_start_time = time.time()
+                                record_question_time()
+                                st.session_state.current_q = next_q
                                 st.rerun()
                         else:
                             if st.button("Finish 🏁", use_container_width=True, type="primary"):
-                                st.session_state.quiz_completed = True
+                                complete_quiz(questions, perm)
                                 st.rerun()
                     with practice_col3:
                         if current_answer:
@@ -884,18 +2760,19 @@ def main():
                                 # Show correct answer
                                 correct_answer = current_q['correct_answer']
                                 if current_answer == correct_answer:
-                                    st.success(f"🎉 Correct! Answer: {correct_answer}")
+                                    st.success(f"🎉 Correct! Answer: {shown_letter[correct_answer]}")
                                     autoplay_audio("correct")
                                     # Add XP for correct answer
                                     st.session_state.user_profile['xp'] += 10
                                 else:
-                                    st.error(f"❌ Incorrect! Correct answer: {correct_answer}")
+                                    st.error(f"❌ Incorrect! Correct answer: {shown_letter[correct_answer]}")
                                     autoplay_audio("wrong")
                         else:
                             st.button("✅ Check Answer", use_container_width=True, disabled=True)
                     with practice_col4:
                         if st.button("🔄 Restart", use_container_width=True):
-                            for key in ['user_answers', 'current_q', 'quiz_completed', 'marked_review', 'show_ai_explanation']:
+                            for key in ['user_answers', 'current_q', 'quiz_completed', 'marked_review', 'show_ai_explanation',
+                                        'question_times', 'quiz_results', 'results_figure']:
                                 if key in st.session_state:
                                     if key == 'show_ai_explanation':
                                         st.session_state[key] = {}
@@ -903,6 +2780,8 @@ def main():
                                         st.session_state[key] = set()
                                     else:
                                         st.session_state[key] = default_states[key]
+                            st.session_state.current_q = first_question(questions)
+                            st.session_state.adaptive_selector = None
                             st.session_state.quiz_started = True
                             st.session_state.start_time = time.time()
                             st.session_state.question_start_time = time.time()
@@ -910,55 +2789,45 @@ def main():
             
             else:
                 # Results screen
-                st.balloons()
+                timer.section("results")
                 st.markdown('<div class="main-header">🏆 Quiz Completed!</div>', unsafe_allow_html=True)
                 
-                # Calculate results
-                correct_count = 0
-                for q in questions:
-                    if st.session_state.user_answers.get(q['id']) == q['correct_answer']:
-                        correct_count += 1
-                
-                total_time = time.time() - st.session_state.start_time
-                score_percent = (correct_count / len(questions)) * 100
-                
-                # Update user profile
-                st.session_state.user_profile['total_quizzes'] += 1
-                st.session_state.user_profile['xp'] += correct_count * 5
-                if score_percent >= 90:
-                    st.session_state.user_profile['achievements'].append("Quiz Master")
+                # Graded once when the quiz finished; reruns only read the frozen summary
+                results = st.session_state.quiz_results or complete_quiz(questions, perm)
+                if st.session_state.celebrate:
+                    st.balloons()
+                    st.session_state.celebrate = False
+                correct_count, score_percent = results['correct'], results['score_percent']
+                timed_rows = [row for row in results['questions'] if row['seconds'] > 0]
+                average_time = sum(row['seconds'] for row in timed_rows) / len(timed_rows) if timed_rows else 0
                 
                 st.markdown(f"""
                 <div style="background: linear-gradient(135deg, #00b09b, #96c93d); color: white; padding: 2rem; border-radius: 20px; text-align: center; margin-bottom: 2rem;">
-                    <h2>Your Score: {correct_count}/{len(questions)}</h2>
+                    <h2>Your Score: {correct_count}/{results['total']}</h2>
                     <h1>{score_percent:.1f}%</h1>
-                    <p>Time Taken: {int(total_time // 60):02d}:{int(total_time % 60):02d}</p>
+                    <p>Time Taken: {format_duration(results['total_time'])} · Average per Question: {format_duration(average_time)}</p>
                     <p>{'🎯 Perfect Score!' if score_percent == 100 else '🌟 Excellent!' if score_percent >= 90 else '👍 Great Job!'}</p>
                 </div>
                 """, unsafe_allow_html=True)
                 
                 # Performance chart
-                fig = go.Figure(go.Indicator(
-                    mode = "gauge+number+delta",
-                    value = score_percent,
-                    domain = {'x': [0, 1], 'y': [0, 1]},
-                    title = {'text': "Performance Score"},
-                    gauge = {
-                        'axis': {'range': [None, 100]},
-                        'bar': {'color': "darkblue"},
-                        'steps': [
-                            {'range': [0, 50], 'color': "lightgray"},
-                            {'range': [50, 80], 'color': "gray"}],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': 90}}))
+                st.plotly_chart(results_figure(results), use_container_width=True)
                 
-                st.plotly_chart(fig, use_container_width=True)
+                # Per-question timing
+                with st.expander("⏱️ Time per Question"):
+                    if timed_rows:
+                        slowest = max(timed_rows, key=lambda row: row['seconds'])
+                        st.caption(f"Slowest: Q{slowest['position']} ({format_duration(slowest['seconds'])})")
+                    st.dataframe([{"Question": f"Q{row['position']}",
+                                   "Time": format_duration(row['seconds']),
+                                   "Result": "✅" if row['correct'] else "❌" if row['answered'] else "—"}
+                                  for row in results['questions']],
+                                 use_container_width=True, hide_index=True)
                 
                 # Restart button
                 if st.button("🔄 Start New Quiz", use_container_width=True, type="primary"):
-                    for key in ['user_answers', 'current_q', 'quiz_completed', 'marked_review', 'show_ai_explanation']:
+                    for key in ['user_answers', 'current_q', 'quiz_completed', 'marked_review', 'show_ai_explanation',
+                                'question_times', 'quiz_results', 'results_figure']:
                         if key in st.session_state:
                             if key == 'show_ai_explanation':
                                 st.session_state[key] = {}
@@ -966,13 +2835,16 @@ def main():
                                 st.session_state[key] = set()
                             else:
                                 st.session_state[key] = default_states[key]
+                    st.session_state.current_q = first_question(questions)
+                    st.session_state.adaptive_selector = None
                     st.session_state.quiz_started = True
                     st.session_state.start_time = time.time()
                     st.session_state.question_start_time = time.time()
                     st.rerun()
 
     else:
-        st.info("👆 Please upload a PDF file to start the quiz")
+        timer.section("landing")
+        st.info("👆 Please upload a PDF file or a question bank to start the quiz")
         st.markdown("""
         ### 📝 Expected PDF Format:
         ```
@@ -990,8 +2862,32 @@ def main():
         D) Saturn
         Answer: B
         ```
+        
+        ### 📊 Question Bank Format (CSV / JSON Lines / XLSX):
+        ```
+        question,A,B,C,D,answer,difficulty
+        What is the capital of France?,London,Berlin,Paris,Madrid,C,Easy
+        ```
         """)
 
+if __name__ == PARSE_WORKER_NAME:
+    # A ParseJobQueue worker process, see ParseJobQueue._spawn
+    run_parse_worker(PARSE_WORKER_CONN)
+
 if __name__ == "__main__":
-    main()
+    st.session_state.rerun_timer = RerunTimer(get_metrics())
+    profile_rerun = st.session_state.get('profile_target') == "rerun"
+    profile_report = {}
+    if profile_rerun:
+        st.session_state.profile_target = None
+    try:
+        with get_profiler().profile("rerun", profile_report) if profile_rerun else contextlib.nullcontext():
+            main()
+    finally:
+        if profile_report:
+            st.session_state.profile_report = profile_report
+        # Also runs when st.rerun() or an early return ends the script
+        st.session_state.rerun_timer.section("session_sync")
+        sync_session_state()
+        st.session_state.rerun_timer.finish()
     
@@ -0,0 +1,71 @@
+"""Cold-start benchmark for app.py.
+
+Every sample runs in a fresh Python process, like a newly started worker:
+  - import: executing app.py's module body (after streamlit itself is imported)
+  - landing: a first script run of the landing page through streamlit's AppTest
+
+Usage:
+    python benchmarks/cold_start.py                 # current app.py
+    python benchmarks/cold_start.py --compare HEAD~1  # also an older revision, from git
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["numpy", "pdfplumber", "pytesseract", "PIL.Image", "pandas", "openpyxl", "plotly.graph_objects"]
+
+SAMPLE = r"""
+import json, os, sys, time, runpy
+path, kind = sys.argv[1], sys.argv[2]
+os.environ.setdefault("PDF_QUIZ_DATA_DIR", sys.argv[3])
+import streamlit
+preloaded = set(sys.modules)  # streamlit may pull some of these in itself
+start = time.perf_counter()
+if kind == "import":
+    runpy.run_path(path, run_name="app")  # module body only, main() is not called
+else:
+    from streamlit.testing.v1 import AppTest
+    AppTest.from_file(path, default_timeout=120).run()
+seconds = time.perf_counter() - start
+heavy = [m for m in %r if m in sys.modules and m not in preloaded]
+print(json.dumps({"seconds": seconds, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+def sample(path, kind, data_dir):
+    """Time one cold start in a fresh interpreter"""
+    result = subprocess.run([sys.executable, "-c", SAMPLE, path, kind, data_dir],
+                            capture_output=True, text=True, check=True, cwd=os.path.dirname(path))
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def benchmark(label, path, runs, data_dir):
+    """Print median / min cold-start times for one copy of the app"""
+    for kind in ("import", "landing"):
+        samples = [sample(path, kind, data_dir) for _ in range(runs)]
+        times = [s["seconds"] * 1000 for s in samples]
+        print(f"{label:>12} {kind:>8}: median {statistics.median(times):8.1f} ms  min {min(times):8.1f} ms"
+              f"  heavy modules app.py loaded: {', '.join(samples[-1]['heavy']) or 'none'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--compare", metavar="REV", help="also benchmark app.py as of this git revision")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "data")
+        benchmark("working tree", os.path.join(ROOT, "app.py"), args.runs, data_dir)
+        if args.compare:
+            old_path = os.path.join(tmp, "app.py")
+            source = subprocess.run(["git", "show", f"{args.compare}:app.py"], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout
+            with open(old_path, "w") as f:
+                f.write(source)
+            benchmark(args.compare, old_path, args.runs, data_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Load test: N simulated students driving one app.py process headlessly.
+
+Each simulated session runs through streamlit's AppTest, like a browser tab:
+it loads a question bank (a generated CSV, or --pdf / --bank), switches to
+exam mode, answers every question after a random think time, marks some
+questions for review on the way and finishes the exam.
+
+Every session count in --sessions runs in a fresh process, so the memory
+numbers are not polluted by the previous step. For each step the harness
+reports percentiles of the app's own time per interaction, read from the
+pdfquiz_rerun_seconds histogram the app records, plus CPU time and resident
+memory growth per session and the slowest spans from pdfquiz_span_seconds.
+"harness p50" is what AppTest.run() took end to end; the difference is
+AppTest recompiling app.py on every run, which a real server does not do.
+"busy" is the share of the step's wall time the app spent in reruns.
+
+AppTest swaps a process-global runtime in and out around every run, so the
+sessions' reruns go through one lock and never run at the same time. Think
+times overlap, but GIL and lock contention between concurrent reruns are not
+measured; drive a `streamlit run` server for that.
+
+Usage:
+    python benchmarks/load_test.py --sessions 1,5,10,25 --think 2
+    python benchmarks/load_test.py --sessions 4 --pdf questions.pdf --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "app.py")
+PERCENTILES = (50, 95, 99)
+SLOWEST_SPANS = 5
+RERUN_LOCK = threading.Lock()
+
+def generated_bank(questions):
+    """A CSV bank with the given number of questions"""
+    lines = ["question,A,B,C,D,answer"]
+    for n in range(1, questions + 1):
+        lines.append(f"Load test question {n} about topic {n % 7}?,First {n},Second {n},Third {n},Fourth {n},"
+                     f"{'ABCD'[n % 4]}")
+    return ("load_test_bank.csv", "\n".join(lines).encode())
+
+def rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class Student:
+    """One simulated browser session"""
+    def __init__(self, upload, think, mark_rate, timeout, seed, metrics=None):
+        from streamlit.testing.v1 import AppTest
+        self.app = AppTest.from_file(APP, default_timeout=timeout)
+        self.upload = upload
+        self.think = think
+        self.mark_rate = mark_rate
+        self.rng = random.Random(seed)
+        self.metrics = metrics  # the app's process-wide registry, shared by every session
+        self.latencies = []  # app time per interaction, including any st.rerun() it triggers
+        self.harness = []  # AppTest.run() end to end
+        self.error = None
+
+    def app_seconds(self):
+        histogram = self.metrics.histograms.get(("pdfquiz_rerun_seconds", ())) if self.metrics else None
+        return histogram[-1] if histogram else 0.0
+
+    def run(self, action=None):
+        with RERUN_LOCK:
+            # Only one rerun runs at a time, so the histogram's growth is this run's alone
+            before = self.app_seconds()
+            start = time.perf_counter()
+            (action or self.app).run()
+            self.harness.append(time.perf_counter() - start)
+            self.latencies.append(self.app_seconds() - before)
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+    def pause(self):
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+    def button(self, label=None, key_prefix=None):
+        for button in self.app.button:
+            if label is not None and button.label == label:
+                return button.click()
+            if key_prefix is not None and (button.key or "").startswith(key_prefix):
+                return button.click()
+        raise LookupError(f"No button {label or key_prefix!r} on the page")
+
+    def session(self):
+        try:
+            self.run()
+            self.pause()
+            name, data = self.upload
+            self.app.file_uploader[0].set_value((name, data, "application/octet-stream"))
+            self.run()
+            # PDFs are parsed in the background; poll like the status fragment does
+            while self.app.session_state.parse_job is not None:
+                time.sleep(0.25)
+                self.run()
+            self.run(self.button("📝 Exam"))
+            for _ in range(len(self.app.session_state.questions)):
+                self.pause()
+                options = [b for b in self.app.button if (b.key or "").startswith("opt_")]
+                self.run(self.rng.choice(options).click())
+                if self.rng.random() < self.mark_rate:
+                    self.run(self.button("📌 Mark"))
+                    self.run(self.button("✅ Unmark") if self.rng.random() < 0.5 else None)
+                finish = any(b.label == "🏁 Finish Exam" for b in self.app.button)
+                self.run(self.button("🏁 Finish Exam" if finish else "💾 Save & Next"))
+            if not self.app.session_state.quiz_completed:
+                raise RuntimeError("The exam did not finish")
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+def run_step(sessions, upload, think, mark_rate, timeout):
+    """Run one load step in this process and return its measurements"""
+    # One warm-up session pays for imports and process-wide caches
+    warmup = Student(upload, 0, 0, timeout, seed=-1)
+    warmup.session()
+    if warmup.error:
+        return {"sessions": sessions, "errors": [f"warm-up: {warmup.error}"]}
+    metrics = warmup.app.session_state.rerun_timer.metrics
+    metrics.drain()
+
+    rss_before = rss_bytes()
+    cpu_before = sum(os.times()[:2])
+    start = time.perf_counter()
+    students = [Student(upload, think, mark_rate, timeout, seed=n, metrics=metrics) for n in range(sessions)]
+    threads = [threading.Thread(target=student.session) for student in students]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cpu = sum(os.times()[:2]) - cpu_before
+    rss = rss_bytes() - rss_before  # measured while every session's state is still alive
+
+    _, histograms = metrics.drain()
+    spans = {dict(labels)["span"]: {"count": sum(h[:-1]), "mean_ms": h[-1] / sum(h[:-1]) * 1000}
+             for (name, labels), h in histograms.items() if name == "pdfquiz_span_seconds" and sum(h[:-1])}
+
+    import numpy as np
+    latencies = np.array([seconds for student in students for seconds in student.latencies]) * 1000
+    harness = np.array([seconds for student in students for seconds in student.harness]) * 1000
+    return {
+        "sessions": sessions,
+        "reruns": int(latencies.size),
+        **{f"p{p}_ms": float(np.percentile(latencies, p)) if latencies.size else None for p in PERCENTILES},
+        "max_ms": float(latencies.max()) if latencies.size else None,
+        "harness_p50_ms": float(np.percentile(harness, 50)) if harness.size else None,
+        "busy": float(latencies.sum() / 1000 / wall),
+        "spans": spans,
+        "cpu_s_per_session": cpu / sessions,
+        "rss_mib_per_session": rss / sessions / 2**20,
+        "wall_s": wall,
+        "errors": [student.error for student in students if student.error],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,2,4,8", help="comma-separated concurrent session counts")
+    parser.add_argument("--questions", type=int, default=20, help="size of the generated bank")
+    parser.add_argument("--pdf", help="upload this PDF instead of the generated bank")
+    parser.add_argument("--bank", help="upload this CSV / JSONL / XLSX bank instead of the generated one")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds a student spends per action")
+    parser.add_argument("--mark-rate", type=float, default=0.15, help="share of questions marked for review")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds before a single rerun counts as failed")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--step", type=int, help=argparse.SUPPRESS)  # a single step, run in a child process
+    args = parser.parse_args()
+
+    if args.pdf or args.bank:
+        path = args.pdf or args.bank
+        with open(path, "rb") as f:
+            upload = (os.path.basename(path), f.read())
+    else:
+        upload = generated_bank(args.questions)
+
+    if args.step:
+        print(json.dumps(run_step(args.step, upload, args.think, args.mark_rate, args.timeout)))
+        return
+
+    results = []
+    print(f"{'sessions':>8} {'reruns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+          f" {'harness p50':>11} {'busy':>5} {'CPU s/sess':>10} {'RSS MiB/sess':>12} {'wall s':>7}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Keep the load test's sessions, reviews and figures out of the real data directory
+        env = dict(os.environ, PDF_QUIZ_DATA_DIR=data_dir,
+                   PDF_QUIZ_FIGURE_CACHE=os.path.join(data_dir, "figures"))
+        for sessions in [int(n) for n in args.sessions.split(",")]:
+            child = subprocess.run([sys.executable, __file__, *sys.argv[1:], "--step", str(sessions)],
+                                   capture_output=True, text=True, env=env, cwd=ROOT)
+            if child.returncode:
+                sys.exit(f"Step with {sessions} sessions crashed:\n{child.stderr[-2000:]}")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append(result)
+            if result.get("reruns"):
+                print(f"{sessions:>8} {result['reruns']:>7} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f}"
+                      f" {result['p99_ms']:>9.1f} {result['max_ms']:>9.1f} {result['harness_p50_ms']:>11.1f}"
+                      f" {result['busy']:>5.0%} {result['cpu_s_per_session']:>10.2f}"
+                      f" {result['rss_mib_per_session']:>12.1f} {result['wall_s']:>7.1f}")
+                slowest = sorted(result["spans"].items(), key=lambda item: -item[1]["mean_ms"])[:SLOWEST_SPANS]
+                print(f"{'':>8} slowest spans: "
+                      + ", ".join(f"{name} {span['mean_ms']:.1f} ms x{span['count']}" for name, span in slowest))
+            for error in result["errors"]:
+                print(f"{'':>8} error: {error}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
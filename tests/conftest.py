@@ -0,0 +1,19 @@
+"""Shared fixtures: app.py loaded as a module with its data in a temporary directory."""
+import os
+import runpy
+
+import pytest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    data_dir = os.environ.get("PDF_QUIZ_DATA_DIR")
+    os.environ["PDF_QUIZ_DATA_DIR"] = str(tmp_path_factory.mktemp("data"))
+    try:
+        return runpy.run_path(APP, run_name="app")  # module body only, main() is not called
+    finally:
+        if data_dir is None:
+            del os.environ["PDF_QUIZ_DATA_DIR"]
+        else:
+            os.environ["PDF_QUIZ_DATA_DIR"] = data_dir
@@ -0,0 +1,69 @@
+"""Near-duplicate detection and per-question review cards."""
+
+def question(qid, text, options, correct):
+    return {'id': qid, 'question': text, 'options': dict(zip("ABCD", options)), 'correct_answer': correct,
+            'ai_explanation': ""}
+
+def capitals():
+    options = ["Paris", "Madrid", "Rome", "Berlin"]
+    return [question(1, "What is the capital of France?", options, "A"),
+            question(2, "What is the capital of Spain?", options, "B")]
+
+def test_questions_with_different_answers_are_not_merged(app):
+    index = app['DuplicateIndex']()
+    bank = capitals()
+    assert index.register_bank("key", "capitals.csv", bank) == 0
+    assert bank[0]['canonical_id'] != bank[1]['canonical_id']
+    assert bank[1]['duplicate_of'] is None
+
+def test_reworded_copy_is_merged(app):
+    index = app['DuplicateIndex']()
+    first = [question(1, "Which planet is known as the Red Planet?", ["Venus", "Mars", "Jupiter", "Saturn"], "B")]
+    # Same question with different case and punctuation and shuffled options
+    second = [question(7, "which planet is known as the red planet", ["Mars", "Saturn", "Venus", "Jupiter"], "A")]
+    index.register_bank("first", "first.csv", first)
+    assert index.register_bank("second", "second.csv", second) == 1
+    assert second[0]['canonical_id'] == first[0]['canonical_id']
+    assert second[0]['duplicate_of'] == ("first.csv", 1)
+
+def test_same_text_with_a_different_answer_is_not_merged(app):
+    index = app['DuplicateIndex']()
+    options = ["Paris", "Madrid", "Rome", "Berlin"]
+    first = [question(1, "What is the capital of France?", options, "A")]
+    second = [question(1, "What is the capital of France?", options, "C")]  # a wrong answer key
+    index.register_bank("first", "first.csv", first)
+    assert index.register_bank("second", "second.csv", second) == 0
+    assert second[0]['canonical_id'] != first[0]['canonical_id']
+
+def test_stems_with_different_numbers_are_not_merged(app):
+    index = app['DuplicateIndex']()
+    options = ["The war began", "The war ended", "A treaty was signed", "None of these"]
+    bank = [question(1, "In 1914, which of these events happened in Europe?", options, "D"),
+            question(2, "In 1915, which of these events happened in Europe?", options, "D")]
+    assert index.register_bank("key", "history.csv", bank) == 0
+
+def test_reloading_a_bank_reuses_its_canonical_ids(app):
+    index = app['DuplicateIndex']()
+    bank = capitals()
+    index.register_bank("key", "capitals.csv", bank)
+    reloaded = capitals()
+    assert index.register_bank("key", "capitals.csv", reloaded) == 0
+    assert [q['canonical_id'] for q in reloaded] == [q['canonical_id'] for q in bank]
+    # The same content under another file name is a duplicate of the first upload
+    assert index.register_bank("key", "copy.csv", capitals()) == 2
+
+def test_review_cards_are_stored_per_question(app, tmp_path):
+    index = app['DuplicateIndex']()
+    bank = capitals()
+    index.register_bank("key", "capitals.csv", bank)
+    store = app['ReviewStore'](str(tmp_path / "reviews.sqlite3"))
+    store.add_cards(bank)
+    assert store.card(bank[0]['card_id'])['question'] == "What is the capital of France?"
+    assert store.card(bank[1]['card_id'])['question'] == "What is the capital of Spain?"
+
+def test_templated_bank_keeps_buckets_small(app):
+    index = app['DuplicateIndex']()
+    bank = [question(n, f"Which statement about topic {n % 7} is true?",
+                     [f"First {n}", f"Second {n}", "None of these", "All of these"], "C") for n in range(2000)]
+    index.register_bank("templated", "templated.csv", bank)
+    assert max(len(bucket) for bucket in index.buckets.values()) <= app['MAX_BUCKET_SIZE']
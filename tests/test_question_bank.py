@@ -0,0 +1,35 @@
+"""Importing CSV, JSON Lines and XLSX question banks."""
+import io
+import json
+
+import openpyxl
+
+def jsonl(rows):
+    return io.BytesIO("\n".join(json.dumps(row) for row in rows).encode("utf-8"))
+
+def xlsx(rows):
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    data = io.BytesIO()
+    workbook.save(data)
+    data.seek(0)
+    return data
+
+def test_jsonl_numeric_cells_stay_as_written(app):
+    # The second row has no D option, which made the D column a float column when read with read_json
+    bank = jsonl([{"question": "What is 2 + 3?", "A": 4, "B": 5, "C": 6, "D": 7, "answer": "B"},
+                  {"question": "What is 10 / 4?", "A": 2.5, "B": 2, "C": 3, "answer": "A"}])
+    questions, problems = app['import_question_bank'](bank, "bank.jsonl")
+    assert problems == []
+    assert questions[0]['options'] == {"A": "4", "B": "5", "C": "6", "D": "7"}
+    assert questions[1]['options'] == {"A": "2.5", "B": "2", "C": "3"}
+
+def test_xlsx_numeric_cells_stay_as_written(app):
+    bank = xlsx([["Question", "Option A", "Option B", "Option C", "Option D", "Answer"],
+                 ["What is 2 + 3?", 4, 5, 6, 7, "B"],
+                 ["What is 10 / 4?", 2.5, 2, 3, None, "A"]])
+    questions, problems = app['import_question_bank'](bank, "bank.xlsx")
+    assert problems == []
+    assert questions[0]['options'] == {"A": "4", "B": "5", "C": "6", "D": "7"}
+    assert questions[1]['options'] == {"A": "2.5", "B": "2", "C": "3"}
@@ -0,0 +1,35 @@
+"""Finishing a quiz: the frozen summary and the profile rewards."""
+import copy
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+BANK = b"question,A,B,C,D,answer\nCapital of France?,London,Berlin,Paris,Madrid,C\nRed planet?,Venus,Mars,Jupiter,Saturn,B\n"
+
+def click(at, label=None, key=None):
+    button = next(b for b in at.button if b.label == label or (key and b.key == key))
+    button.click().run()
+
+def test_finishing_applies_the_rewards_once_across_reruns(tmp_path, monkeypatch):
+    monkeypatch.setenv("PDF_QUIZ_DATA_DIR", str(tmp_path))
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    at.file_uploader[0].set_value(("bank.csv", BANK, "text/csv"))
+    at.run()
+    click(at, key="opt_1_C")
+    click(at, "Next ▶")
+    click(at, key="opt_2_B")
+    click(at, "Finish 🏁")
+    assert not at.exception
+    assert at.session_state.quiz_results['correct'] == 2
+    assert len(at.get("balloons")) == 1
+    profile = copy.deepcopy(at.session_state.user_profile)
+    assert profile['total_quizzes'] == 1
+    assert profile['xp'] == 10
+    assert profile['achievements'] == ["Quiz Master"]
+    for _ in range(3):
+        at.run()
+    assert at.session_state.user_profile == profile
+    assert len(at.get("balloons")) == 0
@@ -0,0 +1,47 @@
+"""Expiry of sessions, their answers and unused banks in the SQLite session store."""
+import json
+import sqlite3
+import time
+
+def write_session(store, sid, bank_key, age):
+    store.write_batch({sid: json.dumps({'bank_key': bank_key})}, {sid: {1: "A", 2: "B"}}, {bank_key: b"questions"})
+    then = time.time() - age
+    store._conn.execute("UPDATE sessions SET updated = ? WHERE session_id = ?", (then, sid))
+    store._conn.execute("UPDATE banks SET updated = ? WHERE bank_key = ?", (then, bank_key))
+
+def test_sweep_deletes_expired_sessions_with_their_answers_and_banks(app, tmp_path):
+    store = app['SQLiteSessionStore'](str(tmp_path / "sessions.sqlite3"))
+    write_session(store, "old", "old-bank", app['SESSION_TTL'] + 60)
+    write_session(store, "live", "live-bank", 60)
+    store.sweep()
+    assert store.load("old") == (None, {})
+    assert store.load_bank("old-bank") is None
+    assert store.load("live")[1] == {1: "A", 2: "B"}
+    assert store.load_bank("live-bank") == b"questions"
+
+def test_sweep_keeps_banks_still_used_by_a_live_session(app, tmp_path):
+    store = app['SQLiteSessionStore'](str(tmp_path / "sessions.sqlite3"))
+    write_session(store, "old", "shared-bank", app['SESSION_TTL'] + 60)
+    write_session(store, "live", "shared-bank", 60)
+    store._conn.execute("UPDATE banks SET updated = 0")
+    store.sweep()
+    assert store.load_bank("shared-bank") == b"questions"
+
+def test_sweep_keeps_a_new_bank_before_its_session_is_written(app, tmp_path):
+    store = app['SQLiteSessionStore'](str(tmp_path / "sessions.sqlite3"))
+    store.write_batch({}, {}, {"new-bank": b"questions"})
+    store.sweep()
+    assert store.load_bank("new-bank") == b"questions"
+
+def test_store_without_bank_timestamps_is_migrated(app, tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE banks (bank_key TEXT PRIMARY KEY, questions BLOB NOT NULL)")
+    conn.execute("INSERT INTO banks VALUES ('unused-bank', 'questions')")
+    conn.commit()
+    conn.close()
+    store = app['SQLiteSessionStore'](path)
+    store.write_batch({}, {}, {"new-bank": b"questions"})
+    store.sweep()
+    assert store.load_bank("unused-bank") is None
+    assert store.load_bank("new-bank") == b"questions"